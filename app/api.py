@@ -0,0 +1,46 @@
+from datetime import date
+from decimal import Decimal
+
+from flask import jsonify
+from flask import request
+
+
+API_PREFIX = "/api/v1"
+
+
+def json_value(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def json_table(columns, rows):
+    """
+    Compact form of a result: the column names once, then every row as a
+    plain list of values.
+    """
+    return {
+        "columns": list(columns),
+        "rows": [[json_value(value) for value in row] for row in rows],
+    }
+
+
+def json_rows(cur, rows):
+    return json_table([column.name for column in cur.description], rows)
+
+
+def json_response(data, status=200):
+    """
+    JSON response tagged with a hash of its body: clients sending the tag
+    back in If-None-Match get an empty 304 when nothing changed. The views
+    under ResponseCache.cached get the tag of their table versions instead,
+    which answers the 304 before the query runs.
+    """
+    response = jsonify(data)
+    response.status_code = status
+    if status == 200:
+        response.add_etag()
+        response.make_conditional(request)
+    return response
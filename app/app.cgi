@@ -2,5 +2,10 @@
 from wsgiref.handlers import CGIHandler
 
 from app import app
+from app import pool
 
-CGIHandler().run(app)
+try:
+    CGIHandler().run(app)
+finally:
+    # the one connection of the process, if a query opened it
+    pool.close()
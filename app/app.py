@@ -2,6 +2,7 @@
 import os
 from logging.config import dictConfig
 
+import click
 import psycopg
 from flask import flash
 from flask import Flask
@@ -9,17 +10,63 @@ from flask import jsonify
 from flask import redirect
 from flask import render_template
 from flask import request
+from flask import stream_template
 from flask import url_for
 from psycopg.rows import namedtuple_row
-from psycopg_pool import ConnectionPool
 from datetime import datetime
 
+from api import API_PREFIX
+from api import json_response
+from api import json_rows
+from api import json_table
+from batch import run_batch
+from bulk_import import BulkImportError
+from bulk_import import FORMATS
+from bulk_import import IMPORTS
+from bulk_import import import_file
+from catalog import Catalog
+from constraints import constraint_errors
+import database
+from export import EXPORT_CHUNK
+from export import EXPORTS
+from export import MIMETYPES
+from export import export_query
+from export import gzip_chunks
+from filters import FILTERS
+from filters import filter_condition
+import metrics
+from orders import ORDER_ERRORS
+from orders import insert_order
+from orders import order_header
+from orders import order_lines
+from orders import parse_lines
+from orders import parse_order
+from pagination import STREAM_CHUNK
+from pagination import all_rows_query
+from pagination import fetch_page
+from products import delete_products
+from queries import execute
+from reports import REPORTS
+from reports import report_rows
+from response_cache import ResponseCache
+import rows
+from rows import euro
+from rows import row_link
+
 
 # postgres://{user}:{password}@{hostname}:{port}/{database-name}
 DATABASE_URL = os.environ.get("DATABASE_URL", "postgres://db:db@postgres/db")
 
-pool = ConnectionPool(conninfo=DATABASE_URL)
-# the pool starts connecting immediately.
+pool = database.open_pool(DATABASE_URL)
+# the pool starts connecting immediately; under CGI a single connection
+# is opened by the first query instead.
+
+# products and customer numbers of the order and supplier forms, not kept
+# between CGI processes
+catalog = Catalog(pool, DATABASE_URL, listen=database.USE_POOL)
+
+# pages of the lists, kept per version of the tables they show
+responses = ResponseCache(pool)
 
 dictConfig(
     {
@@ -42,7 +89,41 @@ dictConfig(
 
 app = Flask(__name__)
 log = app.logger
-
+metrics.init_app(app)
+database.init_app(app)
+rows.init_app(app)
+
+
+def stream_rows(query, params=None):
+    """
+    Yields the rows of query through a server-side cursor, STREAM_CHUNK rows
+    per round trip, keeping the connection only while the response streams.
+    """
+    with pool.connection() as conn:
+        with conn.cursor(name="stream_rows", row_factory=namedtuple_row) as cur:
+            cur.itersize = STREAM_CHUNK
+            cur.execute(query, params)
+            yield from cur
+
+
+def render_list(table, key, **context):
+    """
+    Renders list.html one keyset page of table at a time (ordered by key),
+    or every row streamed to the client when asked for ?all=1, with the rows
+    the filters of the query string select.
+    """
+    where = filter_condition(table, request.args)
+    context.setdefault("filters", FILTERS.get(table))
+    if request.args.get("all"):
+        return stream_template(
+            "list.html",
+            cursor=stream_rows(*all_rows_query(table, key, where)),
+            **context,
+        )
+    with pool.connection() as conn:
+        with conn.cursor(row_factory=namedtuple_row) as cur:
+            cursor, pages = fetch_page(cur, table, key, where)
+    return render_template("list.html", cursor=cursor, pages=pages, **context)
 
 
 
@@ -114,16 +195,6 @@ def insert_customer():
             "Email already exists."
         )
     try:
-        with pool.connection() as conn:
-            with conn.cursor(row_factory=namedtuple_row) as cur:
-                cur.execute(
-                    """
-                    SELECT cust_no,email FROM customer ORDER BY cust_no;
-                    """,
-                    {},
-                )
-                unique_attributes = cur.fetchall()
-
         if request.method == "POST":
 
             if not request.form["cust_no"]:
@@ -148,39 +219,17 @@ def insert_customer():
                     raise Exception(error[7])
             if len(request.form["address"]) > 255:
                 raise Exception(error[8])
-            
-            for unique in unique_attributes:
-                if (unique[0] == int(request.form["cust_no"])):
-                    raise Exception(error[9])
-                if (unique[1] == request.form["email"]):
-                    raise Exception(error[10])
-            
-            with pool.connection() as conn:
-                with conn.cursor(row_factory=namedtuple_row) as cur:
-                    queries = """
-                        INSERT INTO customer (cust_no, name, email) VALUES (%(cust_no)s, %(name)s, %(email)s);
-                        """
-                    if request.form["phone"]:
-                        queries += """
-                            UPDATE customer SET phone = %(phone)s WHERE cust_no = %(cust_no)s;
-                            """
-                    if request.form["address"]:
-                        queries += """
-                            UPDATE customer SET address = %(address)s WHERE cust_no = %(cust_no)s;
-                            """
-                    for query in queries.split(';'):
-                        if len(query) > 0:
-                            cur.execute(
-                                query + ';',
-                                {"cust_no": request.form["cust_no"],
-                                "name": request.form["name"],
-                                "email": request.form["email"],
-                                "phone": request.form["phone"],
-                                "address": request.form["address"]},
-                            )
-                    conn.commit()
-                cur.close()
-            conn.close
+
+            with constraint_errors(), pool.connection() as conn:
+                run_batch(
+                    conn,
+                    ("insert_customer",),
+                    {"cust_no": request.form["cust_no"],
+                    "name": request.form["name"],
+                    "email": request.form["email"],
+                    "phone": request.form["phone"] or None,
+                    "address": request.form["address"] or None},
+                )
             return redirect(url_for("list_customer"))
     except Exception as e:
         if e.args[0] in error:
@@ -189,44 +238,32 @@ def insert_customer():
 
 
 @app.route("/customer")
+@responses.cached("customer", "orders", "contains", "product", "pay")
 def list_customer():
     try:
-        with pool.connection() as conn:
-            with conn.cursor(row_factory=namedtuple_row) as cur:
-                cur.execute(
-                    """
-                    SELECT * FROM customer ORDER BY cust_no;
-                    """,
-                    {},
-                )
-                cursor = cur.fetchall()
-            cur.close()
-        conn.close
-
-        colnames = ("cust_no", "name", "email", "phone", "address")
-        return render_template(
-                "list.html",
-                cursor=cursor,
+        # with the unpaid orders and the amount owed of each customer
+        colnames = ("cust_no", "name", "email", "phone", "address", "open_orders", "owed")
+        return render_list(
+                "customer_balance",
+                ("cust_no",),
                 colnames=colnames,
+                formats={"owed": euro},
                 title="Customer",
                 row_actions=(
                     {
                         "className": "remove",
-                        "link": lambda record: url_for(
-                            "list_customer_pending", cust=record[0]
-                        ),
+                        "link": row_link("list_customer_pending", "cust"),
                         "name": "Orders to Pay",
                     },
                     {
                         "className": "remove",
-                        "link": lambda record: url_for(
-                            "confirm_delete_customer", customer=record[0]
-                        ),
+                        "link": row_link("confirm_delete_customer", "customer"),
                         "name": "Remove",
                     },
                 ),
                 page_actions=(
                     {"title": "Insert Customer", "link": url_for("ask_customer")},
+                    {"title": "Import customer", "link": url_for("ask_import", table="customer")},
                 ),
             )
     except Exception as e:
@@ -250,27 +287,17 @@ def confirm_delete_customer(customer):
 def delete_customer():
     try:
         with pool.connection() as conn:
-            with conn.cursor(row_factory=namedtuple_row) as cur:
-                queries = """
-                    DELETE FROM process WHERE order_no IN (
-                        SELECT order_no FROM process INNER JOIN orders USING(order_no) WHERE cust_no = %(cust_no)s
-                    );
-                    DELETE FROM contains WHERE order_no IN (
-                        SELECT order_no FROM contains INNER JOIN orders USING(order_no) WHERE cust_no = %(cust_no)s
-                    );
-                    DELETE FROM pay WHERE cust_no = %(cust_no)s;
-                    DELETE FROM orders WHERE cust_no = %(cust_no)s;
-                    DELETE FROM customer WHERE cust_no = %(cust_no)s;
-                    """
-                for query in queries.split(';'):
-                    if len(query) > 0:
-                        cur.execute(
-                            query + ';',
-                            {"cust_no": request.form["cust_no"]},
-                        )
-                conn.commit()
-            cur.close()
-        conn.close
+            run_batch(
+                conn,
+                (
+                    "delete_customer_process",
+                    "delete_customer_contains",
+                    "delete_customer_pay",
+                    "delete_customer_orders",
+                    "delete_customer",
+                ),
+                {"cust_no": request.form["cust_no"]},
+            )
         return redirect(url_for("list_customer"))
     except Exception as e:
         return render_template("error.html", error="Unexpected error")
@@ -281,34 +308,29 @@ def list_customer_pending(cust):
     try:
         with pool.connection() as conn:
             with conn.cursor(row_factory=namedtuple_row) as cur:
-                cur.execute(
-                    """
-                    SELECT order_no, date FROM orders
-                    WHERE cust_no=%(cust_no)s AND order_no NOT IN(
-                        SELECT order_no FROM pay WHERE cust_no=%(cust_no)s
-                    )
-                    ORDER BY date;
-                    """,
+                execute(
+                    cur,
+                    "customer_pending",
                     {"cust_no": cust},
                 )
                 cursor = cur.fetchall()
             cur.close()
         conn.close
 
-        colnames = ("order_no", "date")
+        colnames = ("order_no", "date", "amount")
+        owed = sum(record.amount for record in cursor)
         return render_template(
                 "list.html",
                 cursor=cursor,
                 colnames=colnames,
-                title=f"Orders to pay from Customer '{cust}'",
+                formats={"amount": euro},
+                title=f"Orders to pay from Customer '{cust}': {len(cursor)} open, {owed}€ owed",
                 back_action=url_for("list_customer"),
                 back_action_title="Back to Customer",
                 row_actions=(
                     {
                         "className": "remove",
-                        "link": lambda record: url_for(
-                            "confirm_pay", orders=record[0], customer=cust
-                        ),
+                        "link": row_link("confirm_pay", "orders", customer=cust),
                         "name": "Pay",
                     },
                 ),
@@ -411,16 +433,6 @@ def insert_product():
             "Price must be higher than zero."
         )
     try:
-        with pool.connection() as conn:
-            with conn.cursor(row_factory=namedtuple_row) as cur:
-                cur.execute(
-                    """
-                    SELECT sku,ean FROM product ORDER BY sku;
-                    """,
-                    {},
-                )
-                unique_attributes = cur.fetchall()
-
         if request.method == "POST":
 
             if not request.form["sku"]:
@@ -438,39 +450,16 @@ def insert_product():
                 if not request.form["ean"].isdigit() or len(request.form["ean"]) > 13:
                     raise Exception(error[5])
 
-            for unique in unique_attributes:
-                if (unique[0] == request.form["sku"]):
-                    raise Exception(error[6])
-                if request.form["ean"]:
-                    if (unique[1] == int(request.form["ean"])):
-                        raise Exception(error[7])
-            
-            with pool.connection() as conn:
-                with conn.cursor(row_factory=namedtuple_row) as cur:
-                    queries = """
-                        INSERT INTO product (sku, name, price) VALUES (%(sku)s, %(name)s, %(price)s);
-                        """
-                    if request.form["description"]:
-                        queries += """
-                            UPDATE product SET description = %(description)s WHERE sku = %(sku)s;
-                            """
-                    if request.form["ean"]:
-                        queries += """
-                            UPDATE product SET ean = %(ean)s WHERE sku = %(sku)s;
-                            """
-                    for query in queries.split(';'):
-                        if len(query) > 0:
-                            cur.execute(
-                                query + ';',
-                                {"sku": request.form["sku"],
-                                "name": request.form["name"],
-                                "price": request.form["price"],
-                                "description": request.form["description"],
-                                "ean": request.form["ean"]},
-                            )
-                    conn.commit()
-                cur.close()
-            conn.close
+            with constraint_errors(), pool.connection() as conn:
+                run_batch(
+                    conn,
+                    ("insert_product",),
+                    {"sku": request.form["sku"],
+                    "name": request.form["name"],
+                    "price": request.form["price"],
+                    "description": request.form["description"] or None,
+                    "ean": request.form["ean"] or None},
+                )
             return redirect(url_for("list_product"))
     except Exception as e:
         if e.args[0] in error:
@@ -479,44 +468,31 @@ def insert_product():
 
 
 @app.route("/product")
+@responses.cached("product")
 def list_product():
     try:
-        with pool.connection() as conn:
-            with conn.cursor(row_factory=namedtuple_row) as cur:
-                cur.execute(
-                    """
-                    SELECT * FROM product ORDER BY sku
-                    """,
-                    {},
-                )
-                cursor = cur.fetchall()
-            cur.close()
-        conn.close
-
         colnames = ("sku", "name", "description", "price", "ean")
-        return render_template(
-                "list.html",
-                cursor=cursor,
+        return render_list(
+                "product",
+                ("sku",),
                 colnames=colnames,
+                formats={"price": euro},
                 title="Product",
                 row_actions=(
                     {
                         "className": "remove",
-                        "link": lambda record: url_for(
-                            "ask_change_product", product=record[0]
-                        ),
+                        "link": row_link("ask_change_product", "product"),
                         "name": "Change",
                     },
                     {
                         "className": "remove",
-                        "link": lambda record: url_for(
-                            "confirm_delete_product", product=record[0]
-                        ),
+                        "link": row_link("confirm_delete_product", "product"),
                         "name": "Remove",
                     },
                 ),
                 page_actions=(
                     {"title": "Insert Product", "link": url_for("ask_product")},
+                    {"title": "Import product", "link": url_for("ask_import", table="product")},
                 ),
             )
     except Exception as e:
@@ -571,25 +547,14 @@ def change_product():
         check_price(request.form["price"])
 
         with pool.connection() as conn:
-            with conn.cursor(row_factory=namedtuple_row) as cur:
-                queries = """
-                    UPDATE product SET price = %(price)s WHERE sku = %(sku)s;
-                    """
-                if request.form["description"]:
-                    queries += """
-                        UPDATE product SET description = %(description)s WHERE sku = %(sku)s;
-                        """
-                for query in queries.split(';'):
-                    if len(query) > 0:
-                        cur.execute(
-                            query + ';',
-                            {"price": request.form["price"],
-                            "description": request.form["description"],
-                            "sku": request.form["sku"]},
-                        )
-                conn.commit()
-            cur.close()
-        conn.close
+            # an empty description keeps the current one
+            run_batch(
+                conn,
+                ("update_product",),
+                {"price": request.form["price"],
+                "description": request.form["description"] or None,
+                "sku": request.form["sku"]},
+            )
         return redirect(url_for("list_product"))
     except Exception as e:
         if e.args[0] in error:
@@ -614,33 +579,7 @@ def confirm_delete_product(product):
 def delete_product():
     try:
         with pool.connection() as conn:
-            with conn.cursor(row_factory=namedtuple_row) as cur:
-                queries = """
-                    DELETE FROM delivery WHERE tin IN (
-                        SELECT tin FROM supplier WHERE sku = %(sku)s
-                    );
-                    DELETE FROM supplier WHERE sku = %(sku)s;
-                    DELETE FROM contains WHERE sku = %(sku)s;
-                    DELETE FROM process WHERE order_no NOT IN (
-                        SELECT order_no FROM contains
-                    );
-                    DELETE FROM pay WHERE order_no NOT IN (
-                        SELECT order_no FROM contains
-                    );
-                    DELETE FROM orders WHERE order_no NOT IN (
-                        SELECT order_no FROM contains
-                    );
-                    DELETE FROM product WHERE sku = %(sku)s;
-                    """
-                for query in queries.split(';'):
-                    if len(query) > 0:
-                        cur.execute(
-                            query + ';',
-                            {"sku": request.form["sku"]},
-                        )
-                conn.commit()
-            cur.close()
-        conn.close
+            delete_products(conn, request.form.getlist("sku"))
         return redirect(url_for("list_product"))
     except Exception as e:
         return render_template("error.html", error="Unexpected error")
@@ -651,17 +590,7 @@ def delete_product():
 @app.route("/supplier/insert", methods=["GET"])
 def ask_supplier():
     try:
-        with pool.connection() as conn:
-            with conn.cursor(row_factory=namedtuple_row) as cur:
-                cur.execute(
-                    """
-                    SELECT sku FROM product ORDER BY sku;
-                    """,
-                    {},
-                )
-                cursor = cur.fetchall()
-            cur.close()
-        conn.close
+        skus = catalog.skus()
 
         return render_template(
                 "request.html",
@@ -691,7 +620,7 @@ def ask_supplier():
                         "name": "sku",
                         "type": "select",
                         "required": True,
-                        "options": ((record[0], record[0]) for record in cursor),
+                        "options": ((sku, sku) for sku in skus),
                     },
                     {
                         "label": "New Supplier Date:",
@@ -712,19 +641,10 @@ def insert_supplier():
             "Name must have a maximun of 200 characters.",
             "Address must have a maximun of 255 characters.",
             "\tInvalid Date.\nDate format must be YYYY-MM-DD",
-            "TIN already exists"
+            "TIN already exists",
+            "Product SKU does not exist."
         )
     try:
-        with pool.connection() as conn:
-            with conn.cursor(row_factory=namedtuple_row) as cur:
-                cur.execute(
-                    """
-                    SELECT tin FROM supplier ORDER BY tin;
-                    """,
-                    {},
-                )
-                unique_attributes = cur.fetchall()
-
         if request.method == "POST":
             if not request.form["tin"]:
                 raise Exception(error[0])
@@ -739,45 +659,17 @@ def insert_supplier():
                     datetime.strptime(request.form["date"], "%Y-%m-%d")
                 except Exception as e:
                     raise Exception(error[4])
-            
-            for unique in unique_attributes:
-                if (unique[0] == request.form["tin"]):
-                    raise Exception(error[5])
 
-            with pool.connection() as conn:
-                with conn.cursor(row_factory=namedtuple_row) as cur:
-                    queries = """
-                        INSERT INTO supplier (tin) VALUES (%(tin)s);
-                        """
-                    if request.form["sku"]:
-                        queries += """
-                            UPDATE supplier SET sku = %(sku)s WHERE tin = %(tin)s;
-                            """
-                    if request.form["name"]:
-                        queries += """
-                            UPDATE supplier SET name = %(name)s WHERE tin = %(tin)s;
-                            """
-                    if request.form["address"]:
-                        queries += """
-                            UPDATE supplier SET address = %(address)s WHERE tin = %(tin)s;
-                            """
-                    if request.form["date"]:
-                        queries += """
-                            UPDATE supplier SET date = %(date)s WHERE tin = %(tin)s;
-                            """
-                    for query in queries.split(';'):
-                        if len(query) > 0:
-                            cur.execute(
-                                query + ';',
-                                {"tin": request.form["tin"],
-                                "name": request.form["name"],
-                                "sku": request.form["sku"],
-                                "address": request.form["address"],
-                                "date": request.form["date"]},
-                            )
-                    conn.commit()
-                cur.close()
-            conn.close
+            with constraint_errors(), pool.connection() as conn:
+                run_batch(
+                    conn,
+                    ("insert_supplier",),
+                    {"tin": request.form["tin"],
+                    "name": request.form["name"] or None,
+                    "sku": request.form["sku"] or None,
+                    "address": request.form["address"] or None,
+                    "date": request.form["date"] or None},
+                )
             return redirect(url_for("list_supplier"))
     except Exception as e:
         if e.args[0] in error:
@@ -786,37 +678,25 @@ def insert_supplier():
 
 
 @app.route("/supplier")
+@responses.cached("supplier")
 def list_supplier():
     try:
-        with pool.connection() as conn:
-            with conn.cursor(row_factory=namedtuple_row) as cur:
-                cur.execute(
-                    """
-                    SELECT * FROM supplier ORDER BY tin
-                    """,
-                    {},
-                )
-                cursor = cur.fetchall()
-            cur.close()
-        conn.close
-
         colnames = ("tin", "name", "address", "sku", "date")
-        return render_template(
-                "list.html",
-                cursor=cursor,
+        return render_list(
+                "supplier",
+                ("tin",),
                 colnames=colnames,
                 title="Supplier",
                 row_actions=(
                     {
                         "className": "remove",
-                        "link": lambda record: url_for(
-                            "confirm_delete_supplier", supplier=record[0]
-                        ),
+                        "link": row_link("confirm_delete_supplier", "supplier"),
                         "name": "Remove",
                     },
                 ),
                 page_actions=(
                     {"title": "Insert supplier", "link": url_for("ask_supplier")},
+                    {"title": "Import supplier", "link": url_for("ask_import", table="supplier")},
                 ),
             )
     except Exception as e:
@@ -840,20 +720,14 @@ def confirm_delete_supplier(supplier):
 def delete_supplier():
     try:
         with pool.connection() as conn:
-            with conn.cursor(row_factory=namedtuple_row) as cur:
-                queries = """
-                    DELETE FROM delivery WHERE tin = %(tin)s;
-                    DELETE FROM supplier WHERE tin = %(tin)s;
-                    """
-                for query in queries.split(';'):
-                    if len(query) > 0:
-                        cur.execute(
-                            query + ';',
-                            {"tin": request.form["tin"]},
-                        )
-                conn.commit()
-            cur.close()
-        conn.close
+            run_batch(
+                conn,
+                (
+                    "delete_supplier_deliveries",
+                    "delete_supplier",
+                ),
+                {"tin": request.form["tin"]},
+            )
         return redirect(url_for("list_supplier"))
     except Exception as e:
         return render_template("error.html", error="Unexpected error")
@@ -864,24 +738,8 @@ def delete_supplier():
 @app.route("/orders/insert", methods=["GET"])
 def ask_orders():
     try:
-        with pool.connection() as conn:
-            with conn.cursor(row_factory=namedtuple_row) as cur:
-                cur.execute(
-                    """
-                    SELECT sku, name, price FROM product ORDER BY name, sku;
-                    """,
-                    {},
-                )
-                cursor = cur.fetchall()
-                cur.execute(
-                    """
-                    SELECT cust_no FROM customer ORDER BY cust_no;
-                    """,
-                    {},
-                )
-                cursor2 = cur.fetchall()
-            cur.close()
-        conn.close
+        cursor = catalog.products()
+        cursor2 = catalog.customers()
 
         fields=(
             {
@@ -926,90 +784,25 @@ def ask_orders():
 
 @app.route("/orders/insert",  methods=["GET", "POST"])
 def insert_orders():
-    error = (
-            "Order Number is required.",
-            "Customer Number is required.",
-            "Date is required.",
-            "Order Number must be integer.",
-            "\tInvalid Date.\nDate format must be YYYY-MM-DD",
-            "Order number already exists",
-            "Quantity must be integer.",
-            "Order must include a product."
-        )
+    error = ORDER_ERRORS
     try:
-        with pool.connection() as conn:
-            with conn.cursor(row_factory=namedtuple_row) as cur:
-                cur.execute(
-                    """
-                    SELECT sku FROM product ORDER BY sku;
-                    """,
-                    {},
-                )
-                skus = cur.fetchall()
-                cur.execute(
-                    """
-                    SELECT order_no FROM orders ORDER BY order_no;
-                    """,
-                    {},
-                )
-                unique_attributes = cur.fetchall()
-
         if request.method == "POST":
+            header = order_header(
+                request.form["order_no"],
+                request.form["cust_no"],
+                request.form["date"],
+            )
+            if "lines" in request.form:
+                # compact submission: one {"sku": ..., "qty": ...} per line
+                basket = order_lines(parse_lines(request.form["lines"]))
+            else:
+                basket = order_lines(
+                    (sku, request.form.get(sku)) for sku in catalog.skus()
+                )
 
-            if not request.form["order_no"]:
-                raise Exception(error[0])
-            if not request.form["cust_no"]:
-                raise Exception(error[1])
-            if not request.form["date"]:
-                raise Exception(error[2])
-            try:
-                int(request.form["order_no"])
-            except Exception as e:
-                raise Exception(error[3])
-            
-            try:
-                datetime.strptime(request.form["date"], "%Y-%m-%d")
-            except Exception as e:
-                raise Exception(error[4])
-                
-            for unique in unique_attributes:
-                if (unique[0] == int(request.form["order_no"])):
-                    raise Exception(error[5])
-            
-            
-            aux = False
-            for sku in skus:
-                qty = request.form[sku[0]]
-                if qty:
-                    try:
-                        int(qty)
-                    except Exception as e:
-                        raise Exception(error[6])
-                    if int(qty) > 0:
-                        aux = True
-            if not aux:
-                raise Exception(error[7])
-
-
-            with pool.connection() as conn:
+            with constraint_errors(), pool.connection() as conn:
                 with conn.cursor(row_factory=namedtuple_row) as cur:
-                    for sku in skus:
-                        qty = request.form[sku[0]]
-                        if qty:
-                            cur.execute(
-                                """
-                                INSERT INTO contains (order_no, sku, qty) VALUES (%(order_no)s, %(sku)s, %(qty)s);
-                                """,
-                                {"order_no": request.form["order_no"], "sku": sku[0], "qty": qty},
-                            )
-                    cur.execute(
-                            """
-                            INSERT INTO orders (order_no, cust_no, date) VALUES (%(order_no)s, %(cust_no)s, %(date)s);
-                            """,
-                            {"order_no": request.form["order_no"],
-                            "cust_no": request.form["cust_no"],
-                            "date": request.form["date"]},
-                        )
+                    insert_order(cur, header, basket)
                     conn.commit()
                 cur.close()
             conn.close
@@ -1021,37 +814,25 @@ def insert_orders():
 
 
 @app.route("/orders")
+@responses.cached("orders")
 def list_orders():
     try:
-        with pool.connection() as conn:
-            with conn.cursor(row_factory=namedtuple_row) as cur:
-                cur.execute(
-                    """
-                    SELECT * FROM orders ORDER BY order_no
-                    """,
-                    {},
-                )
-                cursor = cur.fetchall()
-            cur.close()
-        conn.close
-
         colnames = ("order_no", "cust_no", "date")
-        return render_template(
-                "list.html",
-                cursor=cursor,
+        return render_list(
+                "orders",
+                ("order_no",),
                 colnames=colnames,
                 title="Orders",
                 row_actions=(
                     {
                         "className": "remove",
-                        "link": lambda record: url_for(
-                            "list_order_products", orders=record[0]
-                        ),
+                        "link": row_link("list_order_products", "orders"),
                         "name": "Details",
                     },
                 ),
                 page_actions=(
                     {"title": "Insert orders", "link": url_for("ask_orders")},
+                    {"title": "Import orders", "link": url_for("ask_import", table="orders")},
                 ),
             )
     except Exception as e:
@@ -1062,13 +843,10 @@ def list_order_products(orders):
     try:
         with pool.connection() as conn:
             with conn.cursor(row_factory=namedtuple_row) as cur:
-                cur.execute(
-                    """
-                    SELECT sku, name, qty, price
-                    FROM contains INNER JOIN product USING(sku)
-                    WHERE order_no=%(cust_no)s ORDER BY name;
-                    """,
-                    {"cust_no": orders},
+                execute(
+                    cur,
+                    "order_products",
+                    {"order_no": orders},
                 )
                 cursor = cur.fetchall()
             cur.close()
@@ -1079,6 +857,7 @@ def list_order_products(orders):
                 "list.html",
                 cursor=cursor,
                 colnames=colnames,
+                formats={"price": euro},
                 title=f"Order '{orders}'",
                 back_action_title="Back to Orders",
                 back_action=url_for("list_orders"),
@@ -1094,10 +873,9 @@ def pay():
     try:
         with pool.connection() as conn:
             with conn.cursor(row_factory=namedtuple_row) as cur:
-                cur.execute(
-                    """
-                    INSERT INTO pay (order_no, cust_no) VALUES (%(order_no)s, %(cust_no)s);
-                    """,
+                execute(
+                    cur,
+                    "insert_pay",
                     {"order_no": request.form["order_no"],
                     "cust_no": request.form["cust_no"]},
                 )
@@ -1110,24 +888,13 @@ def pay():
 
 
 @app.route("/pay")
+@responses.cached("pay")
 def list_pay():
     try:
-        with pool.connection() as conn:
-            with conn.cursor(row_factory=namedtuple_row) as cur:
-                cur.execute(
-                    """
-                    SELECT * FROM pay ORDER BY order_no
-                    """,
-                    {},
-                )
-                cursor = cur.fetchall()
-            cur.close()
-        conn.close
-
         colnames = ("order_no", "cust_no")
-        return render_template(
-                "list.html",
-                cursor=cursor,
+        return render_list(
+                "pay",
+                ("order_no",),
                 colnames=colnames,
                 title="Pay",
             )
@@ -1135,26 +902,95 @@ def list_pay():
         return render_template("error.html", error="Unexpected error")
     
 @app.route("/contains")
+@responses.cached("contains")
 def list_contains():
     try:
+        colnames = ("order_no", "sku","quantity")
+        return render_list(
+                "contains",
+                ("order_no", "sku"),
+                colnames=colnames,
+                title="Contains",
+            )
+    except Exception as e:
+        return render_template("error.html", error="Unexpected error")
+
+
+@app.route("/product_sales")
+@responses.cached("product_sales")
+def list_product_sales():
+    try:
+        colnames = (
+            "sku", "order_no", "quantity", "total_price", "year",
+            "month", "day_of_month", "day_of_week", "city",
+        )
+        return render_list(
+                "product_sales",
+                ("order_no", "sku"),
+                colnames=colnames,
+                title="Product Sales",
+                page_actions=(
+                    {"title": "Sales Report", "link": url_for("list_report", report="sales")},
+                    {"title": "Daily Average", "link": url_for("list_report", report="daily-average")},
+                ),
+            )
+    except Exception as e:
+        return render_template("error.html", error="Unexpected error")
+
+
+
+
+# most customers shown by /reports/top-customers
+MAX_TOP_CUSTOMERS = 1000
+
+
+@app.route("/reports/top-customers")
+def list_top_customers():
+    """Customers by the total value of their paid orders (E3 query 1), from customer_value."""
+    try:
+        n = max(1, min(request.args.get("n", 10, type=int), MAX_TOP_CUSTOMERS))
         with pool.connection() as conn:
             with conn.cursor(row_factory=namedtuple_row) as cur:
-                cur.execute(
-                    """
-                    SELECT * FROM contains ORDER BY order_no
-                    """,
-                    {},
-                )
+                execute(cur, "top_customers", {"n": n})
                 cursor = cur.fetchall()
-            cur.close()
-        conn.close
 
-        colnames = ("order_no", "sku","quantity")
         return render_template(
                 "list.html",
                 cursor=cursor,
-                colnames=colnames,
-                title="Contains",
+                colnames=("cust_no", "name", "total", "paid_orders"),
+                formats={"total": euro},
+                title=f"Top {n} Customers",
+                row_actions=(
+                    {
+                        "className": "remove",
+                        "link": row_link("list_customer_pending", "cust"),
+                        "name": "Orders to Pay",
+                    },
+                ),
+            )
+    except Exception as e:
+        return render_template("error.html", error="Unexpected error")
+
+
+@app.route("/reports/<string:report>")
+def list_report(report):
+    if report not in REPORTS:
+        return render_template("error.html", error=f"Unknown report '{report}'."), 404
+    try:
+        year = request.args.get("year", datetime.now().year, type=int)
+        with pool.connection() as conn:
+            with conn.cursor(row_factory=namedtuple_row) as cur:
+                cursor = report_rows(cur, report, year)
+
+        return render_template(
+                "list.html",
+                cursor=cursor,
+                colnames=REPORTS[report]["colnames"],
+                title=f"{REPORTS[report]['title']} {year}",
+                page_actions=(
+                    {"title": str(year - 1), "link": url_for("list_report", report=report, year=year - 1)},
+                    {"title": str(year + 1), "link": url_for("list_report", report=report, year=year + 1)},
+                ),
             )
     except Exception as e:
         return render_template("error.html", error="Unexpected error")
@@ -1162,5 +998,329 @@ def list_contains():
 
 
 
+@app.route("/import/<string:table>", methods=["GET"])
+def ask_import(table):
+    try:
+        if table not in IMPORTS:
+            raise Exception(f"Cannot import into '{table}'.")
+        return render_template(
+            "request.html",
+            action_url=url_for("insert_import", table=table),
+            enctype="multipart/form-data",
+            title=f"Import {table}",
+            submit="Import",
+            back_action_title=f"Back to {table}",
+            back_action=url_for(f"list_{table}"),
+            fields=(
+                {
+                    "label": f"File with the columns {', '.join(IMPORTS[table]['columns'])}:*",
+                    "name": "file",
+                    "type": "file",
+                    "required": True,
+                },
+                {
+                    "label": "Format:*",
+                    "name": "format",
+                    "type": "select",
+                    "required": True,
+                    "selected": "csv",
+                    "options": ((fmt, fmt.upper()) for fmt in FORMATS),
+                },
+            ),
+        )
+    except Exception as e:
+        return render_template("error.html", error="Unexpected error")
+
+
+@app.route("/import/<string:table>", methods=["POST"])
+def insert_import(table):
+    try:
+        file = request.files.get("file")
+        if not file or not file.filename:
+            raise BulkImportError(["File is required."])
+        with pool.connection() as conn:
+            import_file(conn, table, file.stream, request.form.get("format") or "csv")
+            conn.commit()
+        return redirect(url_for(f"list_{table}"))
+    except BulkImportError as e:
+        return render_template("error.html", error=e)
+    except Exception as e:
+        return render_template("error.html", error="Unexpected error")
+
+
+def copy_chunks(query):
+    """Yields the data of a COPY ... TO STDOUT in chunks of about EXPORT_CHUNK bytes."""
+    buffer = bytearray()
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            with cur.copy(query) as copy:
+                for data in copy:
+                    buffer += data
+                    if len(buffer) >= EXPORT_CHUNK:
+                        yield bytes(buffer)
+                        buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+@app.route("/export/<string:table>")
+def export_table(table):
+    fmt = request.args.get("format", "csv")
+    if table not in EXPORTS or fmt not in MIMETYPES:
+        return render_template("error.html", error=f"Cannot export '{table}' as {fmt}."), 404
+
+    chunks = copy_chunks(export_query(table, fmt))
+    filename = f"{table}.{fmt}"
+    mimetype = MIMETYPES[fmt]
+    if request.args.get("gzip"):
+        chunks = gzip_chunks(chunks)
+        filename += ".gz"
+        mimetype = "application/gzip"
+    return app.response_class(
+        chunks,
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+@app.cli.command("import")
+@click.argument("table", type=click.Choice(tuple(IMPORTS)))
+@click.argument("file", type=click.File("rb"))
+@click.option("--format", "fmt", type=click.Choice(FORMATS), help="Defaults to the file extension.")
+def import_command(table, file, fmt):
+    """Bulk load a CSV/NDJSON FILE into TABLE."""
+    if fmt is None:
+        fmt = "ndjson" if file.name.endswith((".ndjson", ".jsonl")) else "csv"
+    try:
+        with pool.connection() as conn:
+            count = import_file(conn, table, file, fmt)
+            conn.commit()
+    except BulkImportError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Imported {count} lines into {table}.")
+
+
+@app.cli.command("rebuild-product-sales")
+def rebuild_product_sales_command():
+    """Recompute the product_sales summary from the base tables."""
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            execute(cur, "rebuild_product_sales")
+            count = cur.fetchone()[0]
+        conn.commit()
+    click.echo(f"Rebuilt product_sales: {count} rows.")
+
+
+@app.cli.command("rebuild-customer-value")
+def rebuild_customer_value_command():
+    """Recompute the customer_value summary from the base tables."""
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            execute(cur, "rebuild_customer_value")
+            count = cur.fetchone()[0]
+        conn.commit()
+    click.echo(f"Rebuilt customer_value: {count} rows.")
+
+
+@app.cli.command("migrate")
+def migrate_command():
+    """Apply the schema migrations the database does not have yet."""
+    # CLI-only modules are imported here, not on every (CGI) start
+    from migrations import MigrationError
+    from migrations import migrate
+
+    try:
+        done = migrate(DATABASE_URL, log=click.echo)
+    except MigrationError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Applied {len(done)} migrations." if done else "Nothing to migrate.")
+
+
+@app.cli.command("generate")
+@click.option("--customers", type=int, default=10000, show_default=True)
+@click.option("--products", type=int, default=1000, show_default=True)
+@click.option("--orders", type=int, default=100000, show_default=True)
+@click.option("--lines", type=float, default=5, show_default=True, help="Mean contains lines per order.")
+@click.option("--employees", type=int, default=100, show_default=True)
+@click.option("--workplaces", type=int, default=20, show_default=True)
+@click.option("--suppliers", type=int, help="Defaults to one per product.")
+@click.option("--zipf", type=float, default=1.1, show_default=True, help="Exponent of product popularity.")
+@click.option("--years", type=int, default=3, show_default=True, help="Years of order history.")
+@click.option("--paid", type=float, default=0.8, show_default=True, help="Share of orders paid.")
+@click.option("--workers", type=int, help="Parallel loaders, defaults to the CPUs.")
+@click.option("--chunk", type=int, default=20000, show_default=True, help="Orders per transaction.")
+@click.option("--seed", type=int, default=0, show_default=True)
+@click.option("--prefix", default="gen", show_default=True, help="Prefix of the generated text keys.")
+def generate_command(**options):
+    """Add a synthetic dataset of the given size to the database."""
+    from generate import generate
+
+    try:
+        count, lines = generate(DATABASE_URL, log=click.echo, **options)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Generated {count} orders with {lines} lines.")
+
+
+@app.cli.command("delete-products")
+@click.argument("skus", nargs=-1)
+@click.option("--file", type=click.File("r"), help="File with one SKU per line.")
+def delete_products_command(skus, file):
+    """Delete the products SKUS, and the orders left empty, in one transaction."""
+    skus = list(skus)
+    if file is not None:
+        skus += [line.strip() for line in file if line.strip()]
+    if not skus:
+        raise click.UsageError("No SKU given.")
+    with pool.connection() as conn:
+        delete_products(conn, skus)
+    click.echo(f"Deleted {len(skus)} products.")
+
+
+
+
+def api_list(table, key):
+    try:
+        with pool.connection() as conn:
+            with conn.cursor(row_factory=namedtuple_row) as cur:
+                rows, pages = fetch_page(cur, table, key, filter_condition(table, request.args))
+                data = json_rows(cur, rows)
+        data["previous"] = pages["previous"]
+        data["next"] = pages["next"]
+        return json_response(data)
+    except Exception as e:
+        return json_response({"error": "Unexpected error"}, 500)
+
+
+@app.route(f"{API_PREFIX}/customers")
+@responses.cached("customer")
+def api_customers():
+    return api_list("customer", ("cust_no",))
+
+
+@app.route(f"{API_PREFIX}/products")
+@responses.cached("product")
+def api_products():
+    return api_list("product", ("sku",))
+
+
+@app.route(f"{API_PREFIX}/suppliers")
+@responses.cached("supplier")
+def api_suppliers():
+    return api_list("supplier", ("tin",))
+
+
+@app.route(f"{API_PREFIX}/orders")
+@responses.cached("orders")
+def api_orders():
+    return api_list("orders", ("order_no",))
+
+
+@app.route(f"{API_PREFIX}/orders", methods=["POST"])
+def api_insert_order():
+    """
+    Places an order sent as JSON lines: the header first
+    ({"order_no": ..., "cust_no": ..., "date": ...}), then one
+    {"sku": ..., "qty": ...} per line.
+    """
+    try:
+        header, basket = parse_order(request.get_data(as_text=True))
+        with constraint_errors(), pool.connection() as conn:
+            with conn.cursor() as cur:
+                insert_order(cur, header, basket)
+            conn.commit()
+        return json_response({"order_no": header["order_no"], "lines": len(basket)}, 201)
+    except Exception as e:
+        if e.args and e.args[0] in ORDER_ERRORS:
+            return json_response({"error": e.args[0]}, 400)
+        return json_response({"error": "Unexpected error"}, 500)
+
+
+@app.route(f"{API_PREFIX}/pay")
+@responses.cached("pay")
+def api_pay():
+    return api_list("pay", ("order_no",))
+
+
+@app.route(f"{API_PREFIX}/contains")
+@responses.cached("contains")
+def api_contains():
+    return api_list("contains", ("order_no", "sku"))
+
+
+@app.route(f"{API_PREFIX}/product_sales")
+@responses.cached("product_sales")
+def api_product_sales():
+    return api_list("product_sales", ("order_no", "sku"))
+
+
+@app.route(f"{API_PREFIX}/reports/<string:report>")
+@responses.cached("product_sales")
+def api_report(report):
+    if report not in REPORTS:
+        return json_response({"error": f"Unknown report '{report}'."}, 404)
+    try:
+        year = request.args.get("year", datetime.now().year, type=int)
+        with pool.connection() as conn:
+            with conn.cursor(row_factory=namedtuple_row) as cur:
+                rows = report_rows(cur, report, year)
+        return json_response(json_table(REPORTS[report]["colnames"], rows))
+    except Exception as e:
+        return json_response({"error": "Unexpected error"}, 500)
+
+
+@app.route(f"{API_PREFIX}/orders/<int:orders>/contains")
+@responses.cached("contains", "product")
+def api_order_products(orders):
+    try:
+        with pool.connection() as conn:
+            with conn.cursor(row_factory=namedtuple_row) as cur:
+                execute(
+                    cur,
+                    "order_products",
+                    {"order_no": orders},
+                )
+                data = json_rows(cur, cur.fetchall())
+        return json_response(data)
+    except Exception as e:
+        return json_response({"error": "Unexpected error"}, 500)
+
+
+@app.route(f"{API_PREFIX}/customers/<int:cust>/pending")
+@responses.cached("orders", "contains", "product", "pay")
+def api_customer_pending(cust):
+    try:
+        with pool.connection() as conn:
+            with conn.cursor(row_factory=namedtuple_row) as cur:
+                execute(
+                    cur,
+                    "customer_pending",
+                    {"cust_no": cust},
+                )
+                data = json_rows(cur, cur.fetchall())
+        return json_response(data)
+    except Exception as e:
+        return json_response({"error": "Unexpected error"}, 500)
+
+
+
+
+@app.route("/healthz")
+def healthz():
+    """Whether the app can reach the database, with the pool statistics."""
+    data = database.health(pool)
+    return jsonify(data), 200 if data["status"] == "ok" else 503
+
+
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Request and database metrics of this process, for Prometheus."""
+    return metrics.exposition(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+
+
+
 if __name__ == "__main__":
     app.run()
\ No newline at end of file
@@ -0,0 +1,24 @@
+#!/usr/bin/python3
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.exceptions import HTTPException
+
+from app import app as sync_app
+from async_app import app as async_app
+
+sync_asgi = WsgiToAsgi(sync_app)
+async_routes = async_app.url_map.bind("")
+
+
+async def app(scope, receive, send):
+    """
+    Serves the read views of async_app as coroutines and hands every other
+    request (forms, inserts, deletes, imports, exports) to the WSGI app,
+    which asgiref runs in a worker thread.
+    """
+    if scope["type"] == "http":
+        try:
+            async_routes.match(scope["path"], scope["method"])
+        except HTTPException:
+            await sync_asgi(scope, receive, send)
+            return
+    await async_app(scope, receive, send)
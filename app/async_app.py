@@ -0,0 +1,529 @@
+#!/usr/bin/python3
+import asyncio
+from functools import wraps
+
+import psycopg
+from psycopg.rows import namedtuple_row
+from psycopg_pool import AsyncConnectionPool
+from quart import Response
+from quart import jsonify
+from quart import make_response
+from quart import Quart
+from quart import render_template
+from quart import request
+from quart import stream_template
+from quart import url_for
+
+from api import API_PREFIX
+from api import json_rows
+from filters import FILTERS
+from filters import filter_condition
+from app import DATABASE_URL
+from app import app as sync_app
+from pagination import PAGE_ARGS
+from pagination import STREAM_CHUNK
+from pagination import all_rows_query
+from pagination import fetch_page_async
+from queries import STATEMENTS
+from response_cache import RESPONSE_CACHE
+from response_cache import is_fresh
+from response_cache import table_versions
+from response_cache import tag_response
+from response_cache import version_tag
+import rows
+from rows import euro
+
+
+# opened when the server starts serving, on its event loop
+pool = AsyncConnectionPool(conninfo=DATABASE_URL, open=False)
+
+app = Quart(__name__)
+log = app.logger
+# the row links stay functions of the row here: flask's url_for does not
+# work in a Quart request
+rows.init_app(app)
+
+# the views only the sync app serves (forms, inserts, deletes...) are still
+# linked to from the pages rendered here
+sync_urls = sync_app.url_map.bind("")
+
+
+def build_sync_url(error, endpoint, values):
+    return sync_urls.build(endpoint, values)
+
+
+app.url_build_error_handlers.append(build_sync_url)
+
+
+@app.before_serving
+async def open_pool():
+    await pool.open()
+
+
+@app.after_serving
+async def close_pool():
+    await pool.close()
+
+
+async def fetch_all(query, params=None):
+    """
+    Runs query on a connection of its own, so independent queries of a view
+    can run at the same time with asyncio.gather.
+    """
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await cur.execute(query, params)
+            return await cur.fetchall()
+
+
+async def stream_rows(query, params=None):
+    async with pool.connection() as conn:
+        async with conn.cursor(name="stream_rows", row_factory=namedtuple_row) as cur:
+            cur.itersize = STREAM_CHUNK
+            await cur.execute(query, params)
+            async for record in cur:
+                yield record
+
+
+def page_url(**args):
+    kept = {name: values for name, values in request.args.lists() if name not in PAGE_ARGS}
+    return url_for(request.endpoint, **(request.view_args or {}), **{**kept, **args})
+
+
+async def render_list(table, key, **context):
+    """render_list of the sync app, on the async pool."""
+    where = filter_condition(table, request.args)
+    context.setdefault("filters", FILTERS.get(table))
+    if request.args.get("all"):
+        return await stream_template(
+            "list.html",
+            cursor=stream_rows(*all_rows_query(table, key, where)),
+            **context,
+        )
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            cursor, pages = await fetch_page_async(cur, table, key, request.args, page_url, where)
+    return await render_template("list.html", cursor=cursor, pages=pages, **context)
+
+
+def versioned(*tables):
+    """
+    ETag of the versions of tables, as ResponseCache.cached gives the sync
+    views (without keeping the responses): a matching If-None-Match is
+    answered with a 304 before the view runs its query.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            if not RESPONSE_CACHE:
+                return await view(*args, **kwargs)
+            try:
+                versions, modified = table_versions(
+                    tables, await fetch_all(STATEMENTS["table_versions"], {"tables": list(tables)})
+                )
+            except psycopg.Error:
+                return await view(*args, **kwargs)
+            etag = version_tag(request.endpoint, tables, versions)
+            if is_fresh(request, etag, modified):
+                response = Response("", status=304)
+            else:
+                response = await make_response(await view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            return tag_response(response, etag, modified)
+
+        return wrapper
+
+    return decorator
+
+
+async def json_response(data, status=200):
+    response = jsonify(data)
+    response.status_code = status
+    if status == 200:
+        await response.add_etag()
+        await response.make_conditional(request)
+    return response
+
+
+
+
+@app.route("/")
+async def homepage():
+    try:
+        return await render_template("index.html")
+    except Exception as e:
+        return await render_template("error.html", error="Unexpected error")
+
+
+
+
+@app.route("/customer")
+async def list_customer():
+    try:
+        # with the unpaid orders and the amount owed of each customer
+        colnames = ("cust_no", "name", "email", "phone", "address", "open_orders", "owed")
+        return await render_list(
+                "customer_balance",
+                ("cust_no",),
+                colnames=colnames,
+                formats={"owed": euro},
+                title="Customer",
+                row_actions=(
+                    {
+                        "className": "remove",
+                        "link": lambda record: url_for(
+                            "list_customer_pending", cust=record[0]
+                        ),
+                        "name": "Orders to Pay",
+                    },
+                    {
+                        "className": "remove",
+                        "link": lambda record: url_for(
+                            "confirm_delete_customer", customer=record[0]
+                        ),
+                        "name": "Remove",
+                    },
+                ),
+                page_actions=(
+                    {"title": "Insert Customer", "link": url_for("ask_customer")},
+                    {"title": "Import customer", "link": url_for("ask_import", table="customer")},
+                ),
+            )
+    except Exception as e:
+        return await render_template("error.html", error="Unexpected error")
+
+
+@app.route("/customer/<string:cust>/orders")
+async def list_customer_pending(cust):
+    try:
+        cursor = await fetch_all(STATEMENTS["customer_pending"], {"cust_no": cust})
+
+        colnames = ("order_no", "date", "amount")
+        owed = sum(record.amount for record in cursor)
+        return await render_template(
+                "list.html",
+                cursor=cursor,
+                colnames=colnames,
+                formats={"amount": euro},
+                title=f"Orders to pay from Customer '{cust}': {len(cursor)} open, {owed}€ owed",
+                back_action=url_for("list_customer"),
+                back_action_title="Back to Customer",
+                row_actions=(
+                    {
+                        "className": "remove",
+                        "link": lambda record: url_for(
+                            "confirm_pay", orders=record[0], customer=cust
+                        ),
+                        "name": "Pay",
+                    },
+                ),
+            )
+    except Exception as e:
+        return await render_template("error.html", error="Unexpected error")
+
+
+
+
+@app.route("/product")
+async def list_product():
+    try:
+        colnames = ("sku", "name", "description", "price", "ean")
+        return await render_list(
+                "product",
+                ("sku",),
+                colnames=colnames,
+                formats={"price": euro},
+                title="Product",
+                row_actions=(
+                    {
+                        "className": "remove",
+                        "link": lambda record: url_for(
+                            "ask_change_product", product=record[0]
+                        ),
+                        "name": "Change",
+                    },
+                    {
+                        "className": "remove",
+                        "link": lambda record: url_for(
+                            "confirm_delete_product", product=record[0]
+                        ),
+                        "name": "Remove",
+                    },
+                ),
+                page_actions=(
+                    {"title": "Insert Product", "link": url_for("ask_product")},
+                    {"title": "Import product", "link": url_for("ask_import", table="product")},
+                ),
+            )
+    except Exception as e:
+        return await render_template("error.html", error="Unexpected error")
+
+
+
+
+@app.route("/supplier")
+async def list_supplier():
+    try:
+        colnames = ("tin", "name", "address", "sku", "date")
+        return await render_list(
+                "supplier",
+                ("tin",),
+                colnames=colnames,
+                title="Supplier",
+                row_actions=(
+                    {
+                        "className": "remove",
+                        "link": lambda record: url_for(
+                            "confirm_delete_supplier", supplier=record[0]
+                        ),
+                        "name": "Remove",
+                    },
+                ),
+                page_actions=(
+                    {"title": "Insert supplier", "link": url_for("ask_supplier")},
+                    {"title": "Import supplier", "link": url_for("ask_import", table="supplier")},
+                ),
+            )
+    except Exception as e:
+        return await render_template("error.html", error="Unexpected error")
+
+
+
+
+@app.route("/orders/insert", methods=["GET"])
+async def ask_orders():
+    try:
+        # independent queries: each on its own connection, at the same time
+        cursor, cursor2 = await asyncio.gather(
+            fetch_all(STATEMENTS["catalog_product"]),
+            fetch_all(STATEMENTS["catalog_customer"]),
+        )
+
+        fields=(
+            {
+                "label": "New Order Number:*",
+                "name": "order_no",
+                "required": True,
+            },
+            {
+                "label": "Customer Number:*",
+                "name": "cust_no",
+                "required": True,
+                "type": "select",
+                "options": [(record[0], record[0]) for record in cursor2],
+            },
+            {
+                "label": "New Date:*",
+                "name": "date",
+                "required": True,
+            },
+        )
+        for record in cursor:
+            fields += (
+                {
+                    "label": f"{record[1]}, {record[2]}€",
+                    "name": f"{record[0]}",
+                    "required": False,
+                },
+            )
+
+        return await render_template(
+                "request.html",
+                action_url=url_for("insert_orders"),
+                title="Insert Orders",
+                fields=fields,
+                submit="Place Order",
+                back_action_title="Back to Orders",
+                back_action=url_for("list_orders"),
+            )
+    except Exception as e:
+        return await render_template("error.html", error="Unexpected error")
+
+
+@app.route("/orders")
+async def list_orders():
+    try:
+        colnames = ("order_no", "cust_no", "date")
+        return await render_list(
+                "orders",
+                ("order_no",),
+                colnames=colnames,
+                title="Orders",
+                row_actions=(
+                    {
+                        "className": "remove",
+                        "link": lambda record: url_for(
+                            "list_order_products", orders=record[0]
+                        ),
+                        "name": "Details",
+                    },
+                ),
+                page_actions=(
+                    {"title": "Insert orders", "link": url_for("ask_orders")},
+                    {"title": "Import orders", "link": url_for("ask_import", table="orders")},
+                ),
+            )
+    except Exception as e:
+        return await render_template("error.html", error="Unexpected error")
+
+
+@app.route("/orders/<string:orders>/contains")
+async def list_order_products(orders):
+    try:
+        cursor = await fetch_all(STATEMENTS["order_products"], {"order_no": orders})
+
+        colnames = ("sku", "name", "quantity", "price")
+        return await render_template(
+                "list.html",
+                cursor=cursor,
+                colnames=colnames,
+                formats={"price": euro},
+                title=f"Order '{orders}'",
+                back_action_title="Back to Orders",
+                back_action=url_for("list_orders"),
+            )
+    except Exception as e:
+        return await render_template("error.html", error="Unexpected error")
+
+
+
+
+@app.route("/pay")
+async def list_pay():
+    try:
+        colnames = ("order_no", "cust_no")
+        return await render_list(
+                "pay",
+                ("order_no",),
+                colnames=colnames,
+                title="Pay",
+            )
+    except Exception as e:
+        return await render_template("error.html", error="Unexpected error")
+
+
+@app.route("/contains")
+async def list_contains():
+    try:
+        colnames = ("order_no", "sku","quantity")
+        return await render_list(
+                "contains",
+                ("order_no", "sku"),
+                colnames=colnames,
+                title="Contains",
+            )
+    except Exception as e:
+        return await render_template("error.html", error="Unexpected error")
+
+
+@app.route("/product_sales")
+async def list_product_sales():
+    try:
+        colnames = (
+            "sku", "order_no", "quantity", "total_price", "year",
+            "month", "day_of_month", "day_of_week", "city",
+        )
+        return await render_list(
+                "product_sales",
+                ("order_no", "sku"),
+                colnames=colnames,
+                title="Product Sales",
+                page_actions=(
+                    {"title": "Sales Report", "link": url_for("list_report", report="sales")},
+                    {"title": "Daily Average", "link": url_for("list_report", report="daily-average")},
+                ),
+            )
+    except Exception as e:
+        return await render_template("error.html", error="Unexpected error")
+
+
+
+
+async def api_list(table, key):
+    try:
+        async with pool.connection() as conn:
+            async with conn.cursor(row_factory=namedtuple_row) as cur:
+                rows, pages = await fetch_page_async(
+                    cur, table, key, request.args, page_url, filter_condition(table, request.args)
+                )
+                data = json_rows(cur, rows)
+        data["previous"] = pages["previous"]
+        data["next"] = pages["next"]
+        return await json_response(data)
+    except Exception as e:
+        return await json_response({"error": "Unexpected error"}, 500)
+
+
+@app.route(f"{API_PREFIX}/customers")
+@versioned("customer")
+async def api_customers():
+    return await api_list("customer", ("cust_no",))
+
+
+@app.route(f"{API_PREFIX}/products")
+@versioned("product")
+async def api_products():
+    return await api_list("product", ("sku",))
+
+
+@app.route(f"{API_PREFIX}/suppliers")
+@versioned("supplier")
+async def api_suppliers():
+    return await api_list("supplier", ("tin",))
+
+
+@app.route(f"{API_PREFIX}/orders")
+@versioned("orders")
+async def api_orders():
+    return await api_list("orders", ("order_no",))
+
+
+@app.route(f"{API_PREFIX}/pay")
+@versioned("pay")
+async def api_pay():
+    return await api_list("pay", ("order_no",))
+
+
+@app.route(f"{API_PREFIX}/contains")
+@versioned("contains")
+async def api_contains():
+    return await api_list("contains", ("order_no", "sku"))
+
+
+@app.route(f"{API_PREFIX}/product_sales")
+@versioned("product_sales")
+async def api_product_sales():
+    return await api_list("product_sales", ("order_no", "sku"))
+
+
+@app.route(f"{API_PREFIX}/orders/<int:orders>/contains")
+@versioned("contains", "product")
+async def api_order_products(orders):
+    try:
+        async with pool.connection() as conn:
+            async with conn.cursor(row_factory=namedtuple_row) as cur:
+                await cur.execute(STATEMENTS["order_products"], {"order_no": orders})
+                data = json_rows(cur, await cur.fetchall())
+        return await json_response(data)
+    except Exception as e:
+        return await json_response({"error": "Unexpected error"}, 500)
+
+
+@app.route(f"{API_PREFIX}/customers/<int:cust>/pending")
+@versioned("orders", "contains", "product", "pay")
+async def api_customer_pending(cust):
+    try:
+        async with pool.connection() as conn:
+            async with conn.cursor(row_factory=namedtuple_row) as cur:
+                await cur.execute(STATEMENTS["customer_pending"], {"cust_no": cust})
+                data = json_rows(cur, await cur.fetchall())
+        return await json_response(data)
+    except Exception as e:
+        return await json_response({"error": "Unexpected error"}, 500)
+
+
+
+
+if __name__ == "__main__":
+    app.run()
@@ -0,0 +1,18 @@
+from queries import execute
+
+
+def run_batch(conn, names, params):
+    """
+    Runs the statements of queries.STATEMENTS called names, all with the
+    same params, and commits them as one transaction using pipeline mode:
+    the statements and the COMMIT are sent together and their results read
+    at the end, so the batch costs about one round trip to the database
+    instead of one per statement.
+    An error of any statement (or of the deferred checks at COMMIT) is
+    raised here and nothing of the batch is kept.
+    """
+    with conn.pipeline():
+        with conn.cursor() as cur:
+            for name in names:
+                execute(cur, name, params)
+        conn.commit()
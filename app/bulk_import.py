@@ -0,0 +1,328 @@
+import csv
+import io
+import json
+import os
+
+from psycopg import sql
+
+
+# bytes sent per COPY message when loading a CSV upload
+COPY_CHUNK = int(os.environ.get("COPY_CHUNK", str(1 << 20)))
+# validation errors shown back to the user
+MAX_ERRORS = 50
+
+FORMATS = ("csv", "ndjson")
+
+
+class BulkImportError(Exception):
+    def __init__(self, errors):
+        super().__init__("\n".join(errors))
+        self.errors = errors
+
+
+# helpers for the validation queries: they never raise on bad input, they
+# return NULL so a whole file can be checked in one set-based pass
+HELPERS = """
+CREATE OR REPLACE FUNCTION pg_temp.as_integer(value TEXT) RETURNS INTEGER AS $$
+    SELECT CASE WHEN value ~ '^\\s*[+-]?\\d{1,10}\\s*$' THEN
+        CASE WHEN value::BIGINT BETWEEN -2147483648 AND 2147483647 THEN value::INTEGER END
+    END
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION pg_temp.as_date(value TEXT) RETURNS DATE AS $$
+    SELECT CASE WHEN value ~ '^\\d{4}-\\d{1,2}-\\d{1,2}$' THEN
+        CASE WHEN split_part(value, '-', 1)::INTEGER >= 1
+                AND split_part(value, '-', 2)::INTEGER BETWEEN 1 AND 12 THEN
+            CASE WHEN split_part(value, '-', 3)::INTEGER BETWEEN 1 AND EXTRACT(DAY FROM
+                    make_date(split_part(value, '-', 1)::INTEGER, split_part(value, '-', 2)::INTEGER, 1)
+                    + INTERVAL '1 month - 1 day') THEN
+                value::DATE
+            END
+        END
+    END
+$$ LANGUAGE sql IMMUTABLE;
+"""
+
+NUMERIC = "'^\\s*[+-]?(\\d+\\.?\\d*|\\.\\d+)\\s*$'"
+
+# columns of every importable table and, in the order the form handlers
+# check them, the (message, query returning the offending lines) rules;
+# "orders" files have one line per contains row, repeating the order header
+IMPORTS = {
+    "customer": {
+        "columns": ("cust_no", "name", "email", "phone", "address"),
+        "rules": (
+            ("Customer Number is required.", "NULLIF(cust_no, '') IS NULL"),
+            ("Name is required.", "NULLIF(name, '') IS NULL"),
+            ("Email is required.", "NULLIF(email, '') IS NULL"),
+            ("Customer Number must be integer.", "pg_temp.as_integer(cust_no) IS NULL"),
+            ("Name must have a maximun of 80 characters.", "length(name) > 80"),
+            ("Email must have a maximun of 254 characters.", "length(email) > 254"),
+            ("Invalid phone number.", "phone <> '' AND phone !~ '^[+0-9][0-9]+$'"),
+            ("Phone must have a maximun of 14 digits.", "length(phone) > 15"),
+            ("Address must have a maximun of 255 characters.", "length(address) > 255"),
+            ("Customer number already exists.", """
+                SELECT line FROM import_customer AS s
+                WHERE EXISTS (SELECT 1 FROM customer WHERE cust_no = pg_temp.as_integer(s.cust_no))
+                UNION ALL
+                SELECT line FROM (
+                    SELECT line, row_number() OVER (PARTITION BY pg_temp.as_integer(cust_no) ORDER BY line) AS n
+                    FROM import_customer
+                ) AS d WHERE n > 1
+            """),
+            ("Email already exists.", """
+                SELECT line FROM import_customer AS s
+                WHERE EXISTS (SELECT 1 FROM customer WHERE email = s.email)
+                UNION ALL
+                SELECT line FROM (
+                    SELECT line, row_number() OVER (PARTITION BY email ORDER BY line) AS n
+                    FROM import_customer
+                ) AS d WHERE n > 1
+            """),
+        ),
+        "merge": """
+            INSERT INTO customer (cust_no, name, email, phone, address)
+            SELECT pg_temp.as_integer(cust_no), name, email, NULLIF(phone, ''), NULLIF(address, '')
+            FROM import_customer;
+            """,
+    },
+    "product": {
+        "columns": ("sku", "name", "description", "price", "ean"),
+        "rules": (
+            ("SKU is required.", "NULLIF(sku, '') IS NULL"),
+            ("Name is required.", "NULLIF(name, '') IS NULL"),
+            ("Price is required.", "NULLIF(price, '') IS NULL"),
+            ("SKU must have a maximun of 25 characters.", "length(sku) > 25"),
+            ("Name must have a maximun of 200 characters.", "length(name) > 200"),
+            ("Price must be numeric.", f"price !~ {NUMERIC}"),
+            ("Price must have a maximun of 10 digits.",
+                "length(price) > 11 OR length(ltrim(split_part(trim(price), '.', 1), '+-0')) > 8"),
+            ("Price must have a maximun of 2 decimal digits.", "length(split_part(trim(price), '.', 2)) > 2"),
+            ("Price must be higher than zero.", f"CASE WHEN price ~ {NUMERIC} THEN price::NUMERIC <= 0 END"),
+            ("EAN must be numeric and less than 13 digits.", "ean <> '' AND ean !~ '^[0-9]{1,13}$'"),
+            ("SKU already exists", """
+                SELECT line FROM import_product AS s
+                WHERE EXISTS (SELECT 1 FROM product WHERE sku = s.sku)
+                UNION ALL
+                SELECT line FROM (
+                    SELECT line, row_number() OVER (PARTITION BY sku ORDER BY line) AS n
+                    FROM import_product
+                ) AS d WHERE n > 1
+            """),
+            ("EAN already exists", """
+                SELECT line FROM import_product AS s
+                WHERE s.ean ~ '^[0-9]{1,13}$'
+                    AND EXISTS (SELECT 1 FROM product WHERE ean = CASE WHEN s.ean ~ '^[0-9]{1,13}$' THEN s.ean::NUMERIC END)
+                UNION ALL
+                SELECT line FROM (
+                    SELECT line, row_number() OVER (PARTITION BY ltrim(ean, '0') ORDER BY line) AS n
+                    FROM import_product WHERE ean <> ''
+                ) AS d WHERE n > 1
+            """),
+        ),
+        "merge": """
+            INSERT INTO product (sku, name, description, price, ean)
+            SELECT sku, name, NULLIF(description, ''), price::NUMERIC, NULLIF(ean, '')::NUMERIC
+            FROM import_product;
+            """,
+    },
+    "supplier": {
+        "columns": ("tin", "name", "address", "sku", "date"),
+        "rules": (
+            ("TIN is required.", "NULLIF(tin, '') IS NULL"),
+            ("TIN must have a maximun of 20 characters.", "length(tin) > 20"),
+            ("Name must have a maximun of 200 characters.", "length(name) > 200"),
+            ("Address must have a maximun of 255 characters.", "length(address) > 255"),
+            ("\tInvalid Date.\nDate format must be YYYY-MM-DD", "date <> '' AND pg_temp.as_date(date) IS NULL"),
+            ("TIN already exists", """
+                SELECT line FROM import_supplier AS s
+                WHERE EXISTS (SELECT 1 FROM supplier WHERE tin = s.tin)
+                UNION ALL
+                SELECT line FROM (
+                    SELECT line, row_number() OVER (PARTITION BY tin ORDER BY line) AS n
+                    FROM import_supplier
+                ) AS d WHERE n > 1
+            """),
+            ("Product SKU does not exist.",
+                "sku <> '' AND NOT EXISTS (SELECT 1 FROM product AS p WHERE p.sku = import_supplier.sku)"),
+        ),
+        "merge": """
+            INSERT INTO supplier (tin, name, address, sku, date)
+            SELECT tin, NULLIF(name, ''), NULLIF(address, ''), NULLIF(sku, ''), pg_temp.as_date(date)
+            FROM import_supplier;
+            """,
+    },
+    "orders": {
+        "columns": ("order_no", "cust_no", "date", "sku", "qty"),
+        "rules": (
+            ("Order Number is required.", "NULLIF(order_no, '') IS NULL"),
+            ("Customer Number is required.", "NULLIF(cust_no, '') IS NULL"),
+            ("Date is required.", "NULLIF(date, '') IS NULL"),
+            ("Order Number must be integer.", "pg_temp.as_integer(order_no) IS NULL"),
+            ("\tInvalid Date.\nDate format must be YYYY-MM-DD", "pg_temp.as_date(date) IS NULL"),
+            ("Order number already exists", """
+                SELECT line FROM import_orders AS s
+                WHERE EXISTS (SELECT 1 FROM orders WHERE order_no = pg_temp.as_integer(s.order_no))
+            """),
+            ("Quantity must be integer.", "qty <> '' AND pg_temp.as_integer(qty) IS NULL"),
+            ("Quantity must be positive.", "pg_temp.as_integer(qty) < 0"),
+            ("Order must include a product.", """
+                SELECT line FROM import_orders
+                INNER JOIN (
+                    SELECT order_no FROM import_orders
+                    GROUP BY order_no
+                    HAVING NOT coalesce(bool_or(pg_temp.as_integer(qty) > 0), false)
+                ) AS empty USING(order_no)
+            """),
+            ("Order lines must have the same Customer Number and Date.", """
+                SELECT line FROM import_orders
+                INNER JOIN (
+                    SELECT order_no FROM import_orders
+                    GROUP BY order_no
+                    HAVING count(DISTINCT (cust_no, date)) > 1
+                ) AS mixed USING(order_no)
+            """),
+            ("Customer Number does not exist.", """
+                SELECT line FROM import_orders AS s
+                WHERE NOT EXISTS (SELECT 1 FROM customer WHERE cust_no = pg_temp.as_integer(s.cust_no))
+            """),
+            ("Product SKU does not exist.", """
+                SELECT line FROM import_orders AS s
+                WHERE pg_temp.as_integer(qty) > 0 AND NOT EXISTS (SELECT 1 FROM product WHERE sku = s.sku)
+            """),
+            ("Product repeated in the same order.", """
+                SELECT line FROM (
+                    SELECT line, row_number() OVER (PARTITION BY order_no, sku ORDER BY line) AS n
+                    FROM import_orders WHERE pg_temp.as_integer(qty) > 0
+                ) AS d WHERE n > 1
+            """),
+        ),
+        # contains first: verifica_order checks, at the end of the orders
+        # INSERT, that every order has its lines, and the deferred contains
+        # foreign key that every line has its order only at commit. Empty
+        # and zero quantities are left out, as the order form does
+        "merge": """
+            INSERT INTO contains (order_no, sku, qty)
+            SELECT pg_temp.as_integer(order_no), sku, pg_temp.as_integer(qty)
+            FROM import_orders WHERE pg_temp.as_integer(qty) > 0;
+            INSERT INTO orders (order_no, cust_no, date)
+            SELECT DISTINCT pg_temp.as_integer(order_no), pg_temp.as_integer(cust_no), pg_temp.as_date(date)
+            FROM import_orders;
+            """,
+    },
+}
+
+
+def staging_table(table):
+    return f"import_{table}"
+
+
+def create_staging(cur, table):
+    columns = IMPORTS[table]["columns"]
+    cur.execute(HELPERS)
+    cur.execute(
+        sql.SQL(
+            "CREATE TEMP TABLE {staging} (line BIGINT GENERATED ALWAYS AS IDENTITY, {columns}) ON COMMIT DROP"
+        ).format(
+            staging=sql.Identifier(staging_table(table)),
+            columns=sql.SQL(", ").join(sql.SQL("{} TEXT").format(sql.Identifier(c)) for c in columns),
+        )
+    )
+
+
+def header_columns(table, header):
+    columns = [column.strip().lower() for column in next(csv.reader([header]))]
+    unknown = [column for column in columns if column not in IMPORTS[table]["columns"]]
+    if unknown:
+        raise BulkImportError([f"Unknown column '{column}'." for column in unknown])
+    return columns
+
+
+def copy_csv(cur, table, stream):
+    """
+    Streams a CSV file with a header line into the staging table; the
+    header names the columns, so they can come in any order.
+    """
+    header = stream.readline().decode("utf-8-sig")
+    columns = header_columns(table, header)
+    with cur.copy(
+        sql.SQL("COPY {staging} ({columns}) FROM STDIN (FORMAT csv, ENCODING 'UTF8')").format(
+            staging=sql.Identifier(staging_table(table)),
+            columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+        )
+    ) as copy:
+        while chunk := stream.read(COPY_CHUNK):
+            copy.write(chunk)
+
+
+def copy_ndjson(cur, table, stream):
+    columns = IMPORTS[table]["columns"]
+    with cur.copy(
+        sql.SQL("COPY {staging} ({columns}) FROM STDIN").format(
+            staging=sql.Identifier(staging_table(table)),
+            columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+        )
+    ) as copy:
+        for number, line in enumerate(io.TextIOWrapper(stream, encoding="utf-8-sig"), 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise BulkImportError([f"Line {number}: invalid JSON."])
+            copy.write_row(
+                tuple(None if record.get(c) is None else str(record[c]) for c in columns)
+            )
+
+
+def validate(cur, table):
+    """
+    Runs every rule of the table over the whole staging table at once and
+    returns the first failed rule of each bad line, as "Line n: message".
+    """
+    rules = IMPORTS[table]["rules"]
+    staging = staging_table(table)
+    checks = []
+    for number, (message, rule) in enumerate(rules):
+        if not rule.lstrip().upper().startswith("SELECT"):
+            rule = f"SELECT line FROM {staging} WHERE {rule}"
+        checks.append(f"SELECT line, {number} AS rule FROM ({rule}) AS r{number}")
+    cur.execute(
+        f"""
+        SELECT DISTINCT ON (line) line, rule
+        FROM ({" UNION ALL ".join(checks)}) AS failures
+        ORDER BY line, rule
+        LIMIT {MAX_ERRORS};
+        """
+    )
+    return [f"Line {line}: {rules[rule][0]}" for line, rule in cur.fetchall()]
+
+
+def import_file(conn, table, stream, fmt):
+    """
+    Loads a CSV/NDJSON file of table through COPY into a staging table,
+    checks it with the rules of the insert forms and merges it, all in the
+    current transaction of conn (left for the caller to commit).
+    Returns the number of lines imported, raises BulkImportError otherwise.
+    """
+    if table not in IMPORTS:
+        raise BulkImportError([f"Cannot import into '{table}'."])
+    if fmt not in FORMATS:
+        raise BulkImportError([f"Unknown format '{fmt}'."])
+    with conn.cursor() as cur:
+        create_staging(cur, table)
+        if fmt == "csv":
+            copy_csv(cur, table, stream)
+        else:
+            copy_ndjson(cur, table, stream)
+        errors = validate(cur, table)
+        if errors:
+            raise BulkImportError(errors)
+        cur.execute(
+            sql.SQL("SELECT count(*) FROM {staging}").format(staging=sql.Identifier(staging_table(table)))
+        )
+        count = cur.fetchone()[0]
+        for query in IMPORTS[table]["merge"].split(";"):
+            if query.strip():
+                cur.execute(query)
+    return count
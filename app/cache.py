@@ -0,0 +1,48 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Process-local cache keeping at most max_entries values, and if max_bytes
+    is given at most that many bytes of them (as measured by size): the
+    least recently used one is evicted first. Safe to share between threads.
+    """
+
+    def __init__(self, max_entries, max_bytes=None, size=len):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = size
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                self.entries.move_to_end(key)
+            except KeyError:
+                return default
+            return self.entries[key]
+
+    def set(self, key, value):
+        size = self.size(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self.lock:
+            self.bytes += size - self.sizes.get(key, 0)
+            self.sizes[key] = size
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries or (
+                self.max_bytes is not None and self.bytes > self.max_bytes
+            ):
+                old, _ = self.entries.popitem(last=False)
+                self.bytes -= self.sizes.pop(old)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.bytes = 0
@@ -0,0 +1,103 @@
+import logging
+import os
+import threading
+import time
+
+import psycopg
+from psycopg.rows import namedtuple_row
+
+from queries import execute
+
+
+# channel the notify_catalog trigger of "create all tables.sql" notifies,
+# with the name of the changed table as payload
+CHANNEL = "catalog"
+# seconds before the listener tries again after losing its connection
+LISTEN_RETRY = float(os.environ.get("CATALOG_LISTEN_RETRY", "5"))
+
+log = logging.getLogger(__name__)
+
+
+class Catalog:
+    """
+    Process-local copy of the products and customer numbers the order and
+    supplier forms offer.
+    A table is read once and kept until postgres notifies a change to it on
+    CHANNEL; while the listener is not connected nothing is kept, as a
+    change could go unnoticed.
+    """
+
+    def __init__(self, pool, conninfo, listen=True):
+        self.pool = pool
+        self.conninfo = conninfo
+        # without the listener nothing is kept: every read queries the table
+        self.listen_enabled = listen
+        self.lock = threading.Lock()
+        self.tables = {}
+        # bumped on every invalidation, so a read that raced with one is not kept
+        self.generation = 0
+        self.listening = False
+        self.listener = None
+
+    def start(self):
+        # started on first use rather than on import, so it runs in every
+        # gunicorn worker and not only in the process that forked them
+        with self.lock:
+            if self.listener is None or not self.listener.is_alive():
+                self.listener = threading.Thread(
+                    target=self.listen, name="catalog-listener", daemon=True
+                )
+                self.listener.start()
+
+    def listen(self):
+        while True:
+            try:
+                with psycopg.connect(self.conninfo, autocommit=True) as conn:
+                    conn.execute(f"LISTEN {CHANNEL};")
+                    self.invalidate(listening=True)
+                    for notify in conn.notifies():
+                        self.invalidate(notify.payload)
+            except psycopg.Error as e:
+                log.warning("catalog listener disconnected: %s", e)
+            self.invalidate(listening=False)
+            time.sleep(LISTEN_RETRY)
+
+    def invalidate(self, table=None, listening=None):
+        with self.lock:
+            self.generation += 1
+            if listening is not None:
+                self.listening = listening
+            if table is None:
+                self.tables.clear()
+            else:
+                self.tables.pop(table, None)
+
+    def rows(self, table):
+        if self.listen_enabled:
+            self.start()
+        with self.lock:
+            rows = self.tables.get(table)
+            generation = self.generation
+        if rows is not None:
+            return rows
+
+        with self.pool.connection() as conn:
+            with conn.cursor(row_factory=namedtuple_row) as cur:
+                execute(cur, f"catalog_{table}")
+                rows = cur.fetchall()
+
+        with self.lock:
+            if self.listening and self.generation == generation:
+                self.tables[table] = rows
+        return rows
+
+    def products(self):
+        """(sku, name, price) of every product, by name."""
+        return self.rows("product")
+
+    def skus(self):
+        return sorted(product.sku for product in self.products())
+
+    def customers(self):
+        """cust_no of every customer, in order."""
+        return self.rows("customer")
@@ -0,0 +1,35 @@
+from contextlib import contextmanager
+
+from psycopg import errors
+
+
+# user-facing message for each PRIMARY KEY / UNIQUE / FOREIGN KEY constraint
+# (default postgres names of "create all tables.sql") the insert forms can break
+CONSTRAINT_ERRORS = {
+    "customer_pkey": "Customer number already exists.",
+    "customer_email_key": "Email already exists.",
+    "product_pkey": "SKU already exists",
+    "product_ean_key": "EAN already exists",
+    "supplier_pkey": "TIN already exists",
+    "supplier_sku_fkey": "Product SKU does not exist.",
+    "orders_pkey": "Order number already exists",
+    "contains_pkey": "Order number already exists",
+    "orders_cust_no_fkey": "Customer Number does not exist.",
+    "contains_sku_fkey": "Product SKU does not exist.",
+}
+
+
+@contextmanager
+def constraint_errors():
+    """
+    Lets the database indexes check uniqueness and references: a violation
+    raised by the statements (or the commit, for deferred constraints) inside
+    the block is turned into the matching message of CONSTRAINT_ERRORS.
+    """
+    try:
+        yield
+    except (errors.UniqueViolation, errors.ForeignKeyViolation) as e:
+        message = CONSTRAINT_ERRORS.get(e.diag.constraint_name)
+        if message is None:
+            raise
+        raise Exception(message) from e
@@ -0,0 +1,176 @@
+import os
+from contextlib import contextmanager
+from time import perf_counter
+
+import psycopg
+from flask import g
+from flask import has_request_context
+from flask import make_response
+from flask import render_template
+from flask import request
+from psycopg_pool import PoolTimeout
+
+from api import API_PREFIX
+from api import json_response
+from metrics import METRICS
+from metrics import InstrumentedConnection
+from metrics import InstrumentedPool
+from metrics import current
+from queries import prepare_on_first_run
+
+
+def env_number(name, default, kind=float):
+    value = os.environ.get(name)
+    return default if value in (None, "") else kind(value)
+
+
+# CGI servers set GATEWAY_INTERFACE and run a process per request, which a
+# pool only slows down; DATABASE_POOL=1 (or 0) overrides the guess
+CGI = os.environ.get("GATEWAY_INTERFACE", "").startswith("CGI/")
+USE_POOL = os.environ.get("DATABASE_POOL", "0" if CGI else "1") != "0"
+
+# psycopg_pool.ConnectionPool arguments, from the environment
+POOL_SETTINGS = {
+    "min_size": env_number("POOL_MIN_SIZE", 4, int),
+    # None: as many as min_size
+    "max_size": env_number("POOL_MAX_SIZE", None, int),
+    # seconds a request waits for a connection before getting a 503
+    "timeout": env_number("POOL_TIMEOUT", 5),
+    # requests allowed to wait at once (0: no limit), the others get a 503 at once
+    "max_waiting": env_number("POOL_MAX_WAITING", 0, int),
+    "max_lifetime": env_number("POOL_MAX_LIFETIME", 3600),
+    "max_idle": env_number("POOL_MAX_IDLE", 600),
+}
+# check that a connection still works before handing it to a request
+POOL_CHECK = os.environ.get("POOL_CHECK", "1") != "0"
+# Retry-After of the 503 answered when no connection is free
+RETRY_AFTER = env_number("POOL_RETRY_AFTER", 1, int)
+# connections found broken in a row before giving up on a checkout
+CHECK_ATTEMPTS = 3
+
+
+class Pool(InstrumentedPool):
+    """
+    The app's pool: configured from POOL_SETTINGS (or arguments), preparing
+    the statements of the registry on their first run on each connection,
+    checking connections on checkout and marking the request when it timed
+    out.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("configure", prepare_on_first_run)
+        super().__init__(*args, **{**POOL_SETTINGS, **kwargs})
+
+    def getconn(self, timeout=None):
+        for _ in range(CHECK_ATTEMPTS):
+            try:
+                conn = super().getconn(timeout)
+            except PoolTimeout:
+                if has_request_context():
+                    g.pool_timeout = True
+                raise
+            if not POOL_CHECK or self.usable(conn):
+                return conn
+            # the pool drops it, as it is closed, and opens another
+            conn.close()
+            self.putconn(conn)
+        raise psycopg.OperationalError("No working database connection.")
+
+    @staticmethod
+    def usable(conn):
+        # a plain cursor: the check is not one of the request's statements
+        try:
+            conn.autocommit = True
+            with psycopg.Cursor(conn) as cur:
+                cur.execute("SELECT 1;")
+            conn.autocommit = False
+            return True
+        except psycopg.Error:
+            return False
+
+
+class DirectConnection:
+    """
+    What the app uses of the pool over a single connection, opened on first
+    use and kept for the life of the process: for CGI, where the pool would
+    open POOL_MIN_SIZE connections in background threads for one request.
+    """
+
+    def __init__(self, conninfo, connection_class=None):
+        self.conninfo = conninfo
+        if connection_class is None:
+            connection_class = InstrumentedConnection if METRICS else psycopg.Connection
+        self.connection_class = connection_class
+        self.conn = None
+        self.connections = 0
+
+    def connect(self):
+        if self.conn is None or self.conn.closed:
+            stats = current.get()
+            start = perf_counter()
+            self.conn = self.connection_class.connect(self.conninfo)
+            self.connections += 1
+            if stats is not None:
+                stats.pool_wait += perf_counter() - start
+        return self.conn
+
+    @contextmanager
+    def connection(self, timeout=None):
+        # commits on success and rolls back on error, as the pool does,
+        # but leaves the connection open for the next block
+        conn = self.connect()
+        try:
+            yield conn
+        except BaseException:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        if not conn.closed:
+            conn.commit()
+
+    def get_stats(self):
+        return {"connections_num": self.connections, "pool_size": int(self.conn is not None and not self.conn.closed)}
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+def open_pool(conninfo):
+    """The app's Pool, or a DirectConnection when running as CGI."""
+    return Pool(conninfo=conninfo) if USE_POOL else DirectConnection(conninfo)
+
+
+def health(pool):
+    """Whether a connection can be had and used right now, with the pool stats."""
+    try:
+        with pool.connection(timeout=1) as conn:
+            with psycopg.Cursor(conn) as cur:
+                cur.execute("SELECT 1;")
+        status = "ok"
+    except (PoolTimeout, psycopg.Error):
+        status = "unavailable"
+        # answered here, with the stats, not by pool_timeout_response
+        g.pop("pool_timeout", None)
+    return {"status": status, "pool": pool.get_stats()}
+
+
+def busy_response():
+    message = "The database is busy, try again later."
+    if request.path.startswith(API_PREFIX):
+        response = json_response({"error": message}, 503)
+    else:
+        response = make_response(render_template("error.html", error=message), 503)
+    response.headers["Retry-After"] = str(RETRY_AFTER)
+    return response
+
+
+def pool_timeout_response(response):
+    # the views answer any exception, PoolTimeout too, with an error page
+    return busy_response() if g.get("pool_timeout") else response
+
+
+def init_app(app):
+    # after metrics.init_app, so the metrics see the 503
+    app.after_request(pool_timeout_response)
+    app.register_error_handler(PoolTimeout, lambda error: busy_response())
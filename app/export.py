@@ -0,0 +1,58 @@
+import zlib
+
+from psycopg import sql
+
+
+# every table of "create all tables.sql" and the product_sales summary
+EXPORTS = (
+    "customer",
+    "orders",
+    "pay",
+    "employee",
+    "process",
+    "department",
+    "workplace",
+    "works",
+    "office",
+    "warehouse",
+    "product",
+    "contains",
+    "supplier",
+    "delivery",
+    "product_sales",
+)
+
+MIMETYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+# bytes of each chunk of an export: COPY sends a message per row, too small
+# to be a write (and a compress call) of their own
+EXPORT_CHUNK = 64 * 1024
+
+
+def export_query(table, fmt):
+    """
+    COPY ... TO STDOUT statement writing table as CSV (with a header) or as
+    one JSON object per line.
+    NDJSON goes through CSV with quote and delimiter characters JSON never
+    contains raw, so postgres sends the documents without escaping them.
+    """
+    if fmt == "ndjson":
+        return sql.SQL(
+            "COPY (SELECT row_to_json(t) FROM {table} AS t) TO STDOUT "
+            "(FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+        ).format(table=sql.Identifier(table))
+    return sql.SQL("COPY {table} TO STDOUT (FORMAT csv, HEADER)").format(
+        table=sql.Identifier(table)
+    )
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
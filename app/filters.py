@@ -0,0 +1,70 @@
+from datetime import date
+from decimal import Decimal
+from decimal import InvalidOperation
+
+from psycopg import sql
+
+
+def like_escape(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def contains(text):
+    return f"%{like_escape(text)}%"
+
+
+def prefix(text):
+    return f"{like_escape(text)}%"
+
+
+# query string filters of the list pages, by table: the argument, how the
+# page labels it, and the condition it adds to the query, where {value} is
+# the argument made into the value for the column. Each has an index of
+# migration 4 (or an earlier one) behind it.
+FILTERS = {
+    "customer": (
+        {
+            "arg": "q",
+            "label": "Name, email or phone",
+            "condition": "(name ILIKE {value} OR email ILIKE {value} OR phone ILIKE {value})",
+            "value": contains,
+        },
+    ),
+    "product": (
+        {"arg": "name", "label": "Name starts with", "condition": "name LIKE {value}", "value": prefix},
+        {"arg": "description", "label": "Description", "condition": "description ILIKE {value}", "value": contains},
+        {"arg": "min_price", "label": "Minimum price", "type": "number", "condition": "price >= {value}", "value": Decimal},
+        {"arg": "max_price", "label": "Maximum price", "type": "number", "condition": "price <= {value}", "value": Decimal},
+    ),
+    "orders": (
+        {"arg": "cust_no", "label": "Customer", "type": "number", "condition": "cust_no = {value}", "value": int},
+        {"arg": "from", "label": "From", "type": "date", "condition": "date >= {value}", "value": date.fromisoformat},
+        {"arg": "to", "label": "To", "type": "date", "condition": "date <= {value}", "value": date.fromisoformat},
+    ),
+}
+# the customer list reads the customers with their balance
+FILTERS["customer_balance"] = FILTERS["customer"]
+
+
+def filter_condition(table, args):
+    """
+    The WHERE condition of the filters of table given in args, with a
+    placeholder for each value, and the list of those values; or None
+    without any. Empty or invalid values are left out, as page_args does
+    with the page arguments.
+    """
+    conditions = []
+    values = []
+    for spec in FILTERS.get(table, ()):
+        text = args.get(spec["arg"], "").strip()
+        if not text:
+            continue
+        try:
+            value = spec["value"](text)
+        except (ValueError, InvalidOperation):
+            continue
+        conditions.append(sql.SQL(spec["condition"]).format(value=sql.Placeholder()))
+        values += [value] * spec["condition"].count("{value}")
+    if not conditions:
+        return None
+    return sql.SQL(" AND ").join(conditions), values
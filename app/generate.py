@@ -0,0 +1,339 @@
+import bisect
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+from datetime import date
+from datetime import timedelta
+from itertools import accumulate
+
+import psycopg
+
+
+CITIES = (
+    "Lisboa", "Porto", "Braga", "Coimbra", "Faro", "Setúbal", "Aveiro",
+    "Leiria", "Viseu", "Évora", "Guimarães", "Funchal", "Matosinhos", "Amadora",
+)
+STREETS = (
+    "Rua Augusta", "Avenida da Liberdade", "Rua de Santa Catarina",
+    "Rua Direita", "Avenida Central", "Rua do Comércio", "Rua Nova",
+    "Avenida da República", "Rua 25 de Abril", "Rua das Flores",
+)
+FIRST_NAMES = (
+    "Ana", "João", "Maria", "Pedro", "Sofia", "Tiago", "Inês", "Rui",
+    "Beatriz", "Miguel", "Carla", "Nuno", "Marta", "Diogo", "Rita", "Luís",
+)
+LAST_NAMES = (
+    "Silva", "Santos", "Ferreira", "Pereira", "Oliveira", "Costa",
+    "Rodrigues", "Martins", "Sousa", "Fernandes", "Gonçalves", "Lopes",
+)
+DEPARTMENTS = ("Operacional", "Comercial", "Logística", "Financeiro", "Marketing")
+
+# the triggers of the summaries, which would recompute them on every chunk
+# of a load; they are rebuilt once at the end instead (see
+# rebuild_product_sales and rebuild_customer_value)
+SUMMARY_TRIGGERS = (
+    ("customer", "customer_city"),
+    ("pay", "product_sales_pay"),
+    ("contains", "product_sales_contains"),
+    ("pay", "customer_value_pay_insert"),
+    ("contains", "customer_value_contains_insert"),
+)
+# the tables loaded whose writes bump table_version: every COPY of every
+# worker would wait on the same row of each; their versions are bumped
+# once at the end instead
+VERSIONED_TABLES = ("customer", "product", "supplier", "orders", "pay", "contains")
+VERSION_TRIGGERS = tuple(
+    (table, f"{table}_version_{event}")
+    for table in VERSIONED_TABLES
+    for event in ("insert", "update", "delete", "truncate")
+)
+
+
+def name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def address(rng, number):
+    # "<street> <n>, <postal code> <city>", what city() expects
+    return (
+        f"{rng.choice(STREETS)} {number}, "
+        f"{rng.randint(1000, 9999)}-{rng.randint(0, 999):03d} {rng.choice(CITIES)}"
+    )
+
+
+def zipf_weights(count, exponent):
+    """Cumulative weights of ranks 1..count under Zipf's law, for bisect."""
+    return list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def pick(rng, cumulative):
+    return bisect.bisect(cumulative, rng.random() * cumulative[-1])
+
+
+def copy_rows(cur, statement, rows):
+    with cur.copy(statement) as copy:
+        for row in rows:
+            copy.write_row(row)
+
+
+def start_keys(cur, prefix):
+    """
+    First value of every generated key, after what the tables already hold;
+    text keys are made unique with prefix instead.
+    """
+    cur.execute(
+        """
+        SELECT (SELECT COALESCE(max(cust_no), 0) + 1 FROM customer),
+            (SELECT COALESCE(max(order_no), 0) + 1 FROM orders),
+            (SELECT COALESCE(max(ean), 2000000000000) + 1 FROM product),
+            EXISTS (SELECT FROM product WHERE sku LIKE %(pattern)s);
+        """,
+        {"pattern": f"{prefix}-%"},
+    )
+    cust_no, order_no, ean, used = cur.fetchone()
+    if used:
+        raise ValueError(f"Keys with prefix '{prefix}' already exist: choose another prefix.")
+    return {"cust_no": cust_no, "order_no": order_no, "ean": int(ean)}
+
+
+def sku(spec, i):
+    return f"{spec['prefix']}-P{i}"
+
+
+def ssn(spec, i):
+    return f"{spec['prefix']}-E{i}"
+
+
+def load_reference(cur, spec, rng):
+    """Customers, products, employees, workplaces and suppliers, in one transaction."""
+    keys = spec["keys"]
+    copy_rows(
+        cur,
+        "COPY customer (cust_no, name, email, phone, address) FROM STDIN",
+        (
+            (
+                keys["cust_no"] + i,
+                name(rng),
+                f"customer{keys['cust_no'] + i}@example.com",
+                f"+3519{rng.randint(10000000, 99999999)}",
+                address(rng, rng.randint(1, 300)),
+            )
+            for i in range(spec["customers"])
+        ),
+    )
+    copy_rows(
+        cur,
+        "COPY product (sku, name, description, price, ean) FROM STDIN",
+        (
+            (
+                sku(spec, i),
+                f"Product {i}",
+                f"Generated product {i}",
+                round(rng.lognormvariate(3, 1) + 0.01, 2),
+                keys["ean"] + i,
+            )
+            for i in range(spec["products"])
+        ),
+    )
+
+    # everyone at least 18 years old for check_age
+    today = date.today()
+    oldest = date(today.year - 65, 1, 1)
+    youngest = date(today.year - 18, today.month, 1) - timedelta(days=1)
+    copy_rows(
+        cur,
+        "COPY employee (ssn, tin, bdate, name) FROM STDIN",
+        (
+            (
+                ssn(spec, i),
+                f"{spec['prefix']}-T{i}",
+                oldest + timedelta(days=rng.randint(0, (youngest - oldest).days)),
+                name(rng),
+            )
+            for i in range(spec["employees"])
+        ),
+    )
+
+    # every workplace is either an office or a warehouse (verifica_workplace),
+    # the office/warehouse rows first as their foreign keys are deferred
+    workplaces = [
+        f"{rng.choice(STREETS)} {spec['prefix']}-{i}, {rng.randint(1000, 9999)}-{i % 1000:03d} {rng.choice(CITIES)}"
+        for i in range(spec["workplaces"])
+    ]
+    warehouses = workplaces[::2]
+    offices = workplaces[1::2]
+    copy_rows(cur, "COPY office (address) FROM STDIN", ((a,) for a in offices))
+    copy_rows(cur, "COPY warehouse (address) FROM STDIN", ((a,) for a in warehouses))
+    copy_rows(
+        cur,
+        "COPY workplace (address, lat, long) FROM STDIN",
+        (
+            # a grid, as (lat, long) is unique
+            (a, round(36 + i // 1000 * 0.0001, 6), round(-10 + i % 1000 * 0.0001, 6))
+            for i, a in enumerate(workplaces)
+        ),
+    )
+    cur.execute(
+        """
+        INSERT INTO department (name) SELECT unnest(%(names)s::VARCHAR[]) ON CONFLICT DO NOTHING;
+        """,
+        {"names": list(DEPARTMENTS)},
+    )
+    copy_rows(
+        cur,
+        "COPY works (ssn, name, address) FROM STDIN",
+        (
+            (ssn(spec, i), rng.choice(DEPARTMENTS), rng.choice(workplaces))
+            for i in range(spec["employees"])
+        ),
+    )
+
+    tins = [f"{spec['prefix']}-S{i}" for i in range(spec["suppliers"])]
+    copy_rows(
+        cur,
+        "COPY supplier (tin, name, address, sku, date) FROM STDIN",
+        (
+            (
+                tin,
+                f"Supplier {i}",
+                address(rng, rng.randint(1, 300)),
+                sku(spec, rng.randrange(spec["products"])),
+                date.today() - timedelta(days=rng.randint(0, 3650)),
+            )
+            for i, tin in enumerate(tins)
+        ),
+    )
+    copy_rows(
+        cur,
+        "COPY delivery (address, tin) FROM STDIN",
+        (
+            (warehouse, tin)
+            for tin in tins
+            for warehouse in rng.sample(warehouses, min(len(warehouses), rng.randint(1, 2)))
+        ),
+    )
+
+
+def load_orders(conninfo, spec, first, count):
+    """
+    Orders first .. first + count - 1 of the history, with their contains,
+    pay and process rows, in a transaction of their own: the lines of every
+    order are copied before it, as verifica_order requires.
+    """
+    rng = random.Random(spec["seed"] * 1000003 + first)
+    cumulative = zipf_weights(spec["products"], spec["zipf"])
+    keys = spec["keys"]
+    start = date.fromisoformat(spec["start"])
+    days = spec["days"]
+    today = date.today()
+
+    orders, contains, pay, process = [], [], [], []
+    for i in range(first, first + count):
+        order_no = keys["order_no"] + i
+        cust_no = keys["cust_no"] + rng.randrange(spec["customers"])
+        # order numbers grow with the date, a few days of jitter
+        day = start + timedelta(days=min(days, max(0, i * days // spec["orders"] + rng.randint(-3, 3))))
+        orders.append((order_no, cust_no, day))
+
+        lines = min(spec["products"], max(1, int(rng.expovariate(1 / spec["lines"])) + 1))
+        products = set()
+        while len(products) < lines:
+            products.add(pick(rng, cumulative))
+        for product in products:
+            contains.append((order_no, sku(spec, product), 1 + int(rng.expovariate(0.5))))
+
+        # older orders are more likely to be paid
+        if rng.random() < (spec["paid"] if (today - day).days > 30 else spec["paid"] / 2):
+            pay.append((order_no, cust_no))
+        if spec["employees"] and rng.random() < 0.9:
+            process.append((ssn(spec, rng.randrange(spec["employees"])), order_no))
+
+    with psycopg.connect(conninfo) as conn:
+        with conn.cursor() as cur:
+            copy_rows(cur, "COPY contains (order_no, sku, qty) FROM STDIN", contains)
+            copy_rows(cur, "COPY orders (order_no, cust_no, date) FROM STDIN", orders)
+            copy_rows(cur, "COPY pay (order_no, cust_no) FROM STDIN", pay)
+            copy_rows(cur, "COPY process (ssn, order_no) FROM STDIN", process)
+        conn.commit()
+    return len(orders), len(contains)
+
+
+def set_summary_triggers(conninfo, enabled):
+    with psycopg.connect(conninfo) as conn:
+        for table, trigger in SUMMARY_TRIGGERS + VERSION_TRIGGERS:
+            conn.execute(
+                f"ALTER TABLE {table} {'ENABLE' if enabled else 'DISABLE'} TRIGGER {trigger};"
+            )
+        conn.commit()
+
+
+def generate(conninfo, customers=10000, products=1000, orders=100000, lines=5,
+             employees=100, workplaces=20, suppliers=None, zipf=1.1, years=3,
+             paid=0.8, workers=None, chunk=20000, seed=0, prefix="gen",
+             log=print):
+    """
+    Adds a synthetic dataset to the database: reference tables first, then
+    the order history in chunks of orders copied by parallel workers.
+    The triggers of the summaries (product_sales, customer_value) and of the
+    table versions are off while loading; the summaries are rebuilt and the
+    versions bumped once at the end, so run it when nobody else writes.
+    """
+    rng = random.Random(seed)
+    spec = {
+        "customers": customers,
+        "products": products,
+        "orders": orders,
+        "lines": lines,
+        "employees": employees,
+        "workplaces": max(2, workplaces),
+        "suppliers": products if suppliers is None else suppliers,
+        "zipf": zipf,
+        "days": years * 365,
+        "start": (date.today() - timedelta(days=years * 365)).isoformat(),
+        "paid": paid,
+        "seed": seed,
+        "prefix": prefix,
+    }
+
+    set_summary_triggers(conninfo, False)
+    try:
+        with psycopg.connect(conninfo) as conn:
+            with conn.cursor() as cur:
+                spec["keys"] = start_keys(cur, prefix)
+                load_reference(cur, spec, rng)
+            conn.commit()
+        log(f"Loaded {customers} customers, {products} products, {employees} employees.")
+
+        total_orders = total_lines = 0
+        # spawned workers, not forked copies of a process holding a pool
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = [
+                executor.submit(load_orders, conninfo, spec, first, min(chunk, orders - first))
+                for first in range(0, orders, chunk)
+            ]
+            for future in as_completed(futures):
+                done_orders, done_lines = future.result()
+                total_orders += done_orders
+                total_lines += done_lines
+                log(f"Loaded {total_orders}/{orders} orders ({total_lines} lines).")
+    finally:
+        set_summary_triggers(conninfo, True)
+
+    with psycopg.connect(conninfo) as conn:
+        conn.execute("SELECT rebuild_product_sales();")
+        conn.execute("SELECT rebuild_customer_value();")
+        conn.execute(
+            """
+            INSERT INTO table_version (table_name) SELECT unnest(%(tables)s::VARCHAR[])
+                ON CONFLICT (table_name) DO UPDATE
+                    SET version = table_version.version + 1,
+                        changed_at = GREATEST(table_version.changed_at, clock_timestamp());
+            """,
+            {"tables": list(VERSIONED_TABLES)},
+        )
+        conn.execute("ANALYZE;")
+        conn.commit()
+    log("Rebuilt product_sales and customer_value, bumped the table versions.")
+    return total_orders, total_lines
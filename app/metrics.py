@@ -0,0 +1,273 @@
+import os
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+
+import psycopg
+from flask import request
+from psycopg_pool import ConnectionPool
+
+from queries import statement_stats
+
+
+# METRICS=0 leaves the app without hooks, /metrics and Server-Timing
+METRICS = os.environ.get("METRICS", "1") != "0"
+
+# upper bounds, in seconds, of the histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    """What the database did for the request being served."""
+
+    __slots__ = ("start", "queries", "db_time", "pool_wait", "rows")
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.pool_wait = 0.0
+        self.rows = 0
+
+
+# stats of the current request; None outside of one (CLI, threads of the
+# app), where the cursors do nothing else than psycopg's
+current = ContextVar("request_stats", default=None)
+
+
+class InstrumentedCursor(psycopg.Cursor):
+    def execute(self, query, params=None, **kwargs):
+        stats = current.get()
+        if stats is None:
+            return super().execute(query, params, **kwargs)
+        start = perf_counter()
+        try:
+            return super().execute(query, params, **kwargs)
+        finally:
+            stats.queries += 1
+            stats.db_time += perf_counter() - start
+
+    def executemany(self, query, params_seq, **kwargs):
+        stats = current.get()
+        if stats is None:
+            return super().executemany(query, params_seq, **kwargs)
+        start = perf_counter()
+        try:
+            return super().executemany(query, params_seq, **kwargs)
+        finally:
+            stats.queries += 1
+            stats.db_time += perf_counter() - start
+
+    def fetchone(self):
+        record = super().fetchone()
+        stats = current.get()
+        if stats is not None and record is not None:
+            stats.rows += 1
+        return record
+
+    def fetchmany(self, size=0):
+        records = super().fetchmany(size)
+        stats = current.get()
+        if stats is not None:
+            stats.rows += len(records)
+        return records
+
+    def fetchall(self):
+        records = super().fetchall()
+        stats = current.get()
+        if stats is not None:
+            stats.rows += len(records)
+        return records
+
+
+class InstrumentedServerCursor(psycopg.ServerCursor):
+    # every fetch of a server-side cursor is a round trip
+    def execute(self, query, params=None, **kwargs):
+        stats = current.get()
+        if stats is None:
+            return super().execute(query, params, **kwargs)
+        start = perf_counter()
+        try:
+            return super().execute(query, params, **kwargs)
+        finally:
+            stats.queries += 1
+            stats.db_time += perf_counter() - start
+
+    def fetchmany(self, size=0):
+        stats = current.get()
+        if stats is None:
+            return super().fetchmany(size)
+        start = perf_counter()
+        records = super().fetchmany(size)
+        stats.db_time += perf_counter() - start
+        stats.rows += len(records)
+        return records
+
+
+class InstrumentedConnection(psycopg.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = InstrumentedCursor
+        self.server_cursor_factory = InstrumentedServerCursor
+
+    def commit(self):
+        # the deferred checks, and the statements of a pipeline, run here
+        stats = current.get()
+        if stats is None:
+            return super().commit()
+        start = perf_counter()
+        try:
+            return super().commit()
+        finally:
+            stats.db_time += perf_counter() - start
+
+
+class InstrumentedPool(ConnectionPool):
+    """ConnectionPool of InstrumentedConnection, timing the wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        if METRICS:
+            kwargs.setdefault("connection_class", InstrumentedConnection)
+        super().__init__(*args, **kwargs)
+
+    def getconn(self, timeout=None):
+        stats = current.get()
+        if stats is None:
+            return super().getconn(timeout)
+        start = perf_counter()
+        try:
+            return super().getconn(timeout)
+        finally:
+            stats.pool_wait += perf_counter() - start
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class EndpointMetrics:
+    __slots__ = ("latency", "db_time", "queries", "pool_wait", "rows", "statuses")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.db_time = Histogram()
+        self.queries = 0
+        self.pool_wait = 0.0
+        self.rows = 0
+        self.statuses = {}
+
+
+# endpoint -> EndpointMetrics, for the life of the process (each gunicorn
+# worker has its own, as every Prometheus target of a multi-process server)
+endpoints = {}
+lock = threading.Lock()
+
+
+def record(endpoint, status, stats, elapsed):
+    with lock:
+        metrics = endpoints.get(endpoint)
+        if metrics is None:
+            metrics = endpoints[endpoint] = EndpointMetrics()
+        metrics.latency.observe(elapsed)
+        metrics.db_time.observe(stats.db_time)
+        metrics.queries += stats.queries
+        metrics.pool_wait += stats.pool_wait
+        metrics.rows += stats.rows
+        metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+
+
+def server_timing(stats, elapsed):
+    return (
+        f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries, {stats.rows} rows", '
+        f"pool;dur={stats.pool_wait * 1000:.2f}, "
+        f"total;dur={elapsed * 1000:.2f}"
+    )
+
+
+def histogram_lines(name, label, histogram):
+    total = 0
+    for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+        total += count
+        yield f'{name}_bucket{{{label},le="{bound}"}} {total}'
+    yield f"{name}_sum{{{label}}} {histogram.sum}"
+    yield f"{name}_count{{{label}}} {histogram.count}"
+
+
+def exposition():
+    """The metrics in the Prometheus text format."""
+    with lock:
+        snapshot = sorted(endpoints.items())
+        lines = [
+            "# HELP app_request_duration_seconds Time to answer a request.",
+            "# TYPE app_request_duration_seconds histogram",
+        ]
+        for endpoint, metrics in snapshot:
+            lines += histogram_lines("app_request_duration_seconds", f'endpoint="{endpoint}"', metrics.latency)
+        lines += [
+            "# HELP app_db_duration_seconds Time spent in the database per request.",
+            "# TYPE app_db_duration_seconds histogram",
+        ]
+        for endpoint, metrics in snapshot:
+            lines += histogram_lines("app_db_duration_seconds", f'endpoint="{endpoint}"', metrics.db_time)
+        lines += [
+            "# HELP app_requests_total Requests answered, by status.",
+            "# TYPE app_requests_total counter",
+        ]
+        for endpoint, metrics in snapshot:
+            for status, count in sorted(metrics.statuses.items()):
+                lines.append(f'app_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+        for name, kind, help_text, attribute in (
+            ("app_db_queries_total", "counter", "Statements run.", "queries"),
+            ("app_db_rows_total", "counter", "Rows fetched.", "rows"),
+            ("app_pool_wait_seconds_total", "counter", "Time spent waiting for a pool connection.", "pool_wait"),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for endpoint, metrics in snapshot:
+                lines.append(f'{name}{{endpoint="{endpoint}"}} {getattr(metrics, attribute)}')
+    statements = statement_stats()
+    for name, help_text, column in (
+        ("app_statement_calls_total", "Runs of each statement of the query registry.", 1),
+        ("app_statement_duration_seconds_total", "Time spent running each statement.", 2),
+        ("app_statement_rows_total", "Rows returned or changed by each statement.", 3),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for stat in statements:
+            lines.append(f'{name}{{statement="{stat[0]}"}} {stat[column]}')
+    return "\n".join(lines) + "\n"
+
+
+def start_request():
+    current.set(RequestStats())
+
+
+def finish_request(response):
+    stats = current.get()
+    if stats is not None:
+        elapsed = perf_counter() - stats.start
+        response.headers["Server-Timing"] = server_timing(stats, elapsed)
+        record(request.endpoint or "unknown", response.status_code, stats, elapsed)
+    return response
+
+
+def end_request(exception=None):
+    # threads serve one request after another in the same context
+    current.set(None)
+
+
+def init_app(app):
+    if not METRICS:
+        return
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.teardown_request(end_request)
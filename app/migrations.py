@@ -0,0 +1,694 @@
+import psycopg
+from psycopg import sql
+
+
+# every change to the schema since the first "create all tables.sql", in
+# order, so a database created before any of them can be brought up to
+# date. The script makes all of them for a new database and records their
+# versions in schema_migrations: a new version goes both here and there.
+# A step is either an index, (name, definition), built with CREATE INDEX
+# CONCURRENTLY so the tables stay writable meanwhile, or plain SQL, which
+# must be safe to run again (IF NOT EXISTS, OR REPLACE, DROP ... IF EXISTS
+# before CREATE). Versions are never renumbered once released: add a new one.
+MIGRATIONS = (
+    (1, "foreign key indexes", (
+        ("orders_cust_no_idx", "orders (cust_no)"),
+        ("pay_cust_no_idx", "pay (cust_no)"),
+        ("contains_sku_idx", "contains (SKU)"),
+        ("supplier_sku_idx", "supplier (SKU)"),
+        ("process_order_no_idx", "process (order_no)"),
+        ("delivery_tin_idx", "delivery (TIN)"),
+    )),
+    # b-trees rather than the hash index of the E3 report for the date, as
+    # the app also asks for date ranges and orders by it; name with the
+    # pattern operators so LIKE 'A%' can use it whatever the collation
+    (2, "E3 report indexes", (
+        ("idx_orders_date", "orders (date)"),
+        ("idx_product_price", "product (price)"),
+        ("idx_product_name", "product (name varchar_pattern_ops)"),
+    )),
+    (3, "order year indexes", (
+        ("idx_orders_year", "orders ((EXTRACT(YEAR FROM date)))"),
+        # statistics of the expressions, for the planner
+        "ANALYZE orders;",
+    )),
+    # the filters of the list pages: trigram indexes for the substring
+    # searches (ILIKE '%...%'), which no b-tree can serve, and the orders of
+    # a customer by date; the name prefix and price range use version 2's
+    (4, "list filter indexes", (
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+        ("idx_customer_name_trgm", "customer USING gin (name gin_trgm_ops)"),
+        ("idx_customer_email_trgm", "customer USING gin (email gin_trgm_ops)"),
+        ("idx_customer_phone_trgm", "customer USING gin (phone gin_trgm_ops)"),
+        ("idx_product_description_trgm", "product USING gin (description gin_trgm_ops)"),
+        ("idx_orders_cust_no_date", "orders (cust_no, date)"),
+    )),
+    # what every customer owes, as in "create all tables.sql"
+    (5, "customer balance view", (
+        """
+        CREATE OR REPLACE VIEW customer_balance AS
+        SELECT customer.*,
+            unpaid.open_orders,
+            COALESCE(unpaid.owed, 0) AS owed
+        FROM customer
+        LEFT JOIN LATERAL (
+            SELECT count(DISTINCT o.order_no) AS open_orders,
+                SUM(c.qty * p.price) AS owed
+            FROM orders AS o
+            INNER JOIN contains AS c USING(order_no)
+            INNER JOIN product AS p USING(SKU)
+            WHERE o.cust_no = customer.cust_no
+                AND NOT EXISTS (SELECT FROM pay WHERE pay.order_no = o.order_no)
+        ) AS unpaid ON TRUE;
+        """,
+    )),
+    # the customer lifetime value summary, as in "create all tables.sql",
+    # filled from the orders paid so far. The block runs as one transaction
+    # and can be run again, as can the rebuild
+    (6, "customer value summary", (
+        """
+        --total value of the paid orders of every customer (E3 query 1), kept by the
+        --triggers below: only customers with a paid order have a row
+        CREATE TABLE IF NOT EXISTS customer_value(
+            cust_no INTEGER PRIMARY KEY REFERENCES customer ON DELETE CASCADE,
+            total NUMERIC(16, 2) NOT NULL,
+            paid_orders INTEGER NOT NULL
+        );
+
+        CREATE INDEX IF NOT EXISTS customer_value_total_idx ON customer_value (total DESC, cust_no);
+
+        --one writer of the value of a customer at a time: the lock is held until
+        --commit, so a transaction changing the same customers waits here, and its
+        --next statement (under READ COMMITTED) sees what the first one committed.
+        --NO KEY UPDATE does not conflict with the KEY SHARE of the foreign keys
+        CREATE OR REPLACE FUNCTION lock_customer_value(customers INTEGER[]) RETURNS VOID AS $$
+        BEGIN
+            PERFORM FROM customer WHERE cust_no = ANY(customers) ORDER BY cust_no FOR NO KEY UPDATE;
+        END
+        $$ LANGUAGE plpgsql;
+
+        --recomputes the rows of the given customers from pay, contains and product.
+        --Recomputing rather than adding differences keeps it right when a single
+        --statement deletes lines and payments together (delete_products), as the
+        --triggers all run after the statement and see what it left; the lock
+        --keeps two transactions from overwriting each other's totals
+        CREATE OR REPLACE FUNCTION refresh_customer_value(customers INTEGER[]) RETURNS VOID AS $$
+        BEGIN
+            PERFORM lock_customer_value(customers);
+            WITH totals AS (
+                SELECT pay.cust_no, SUM(c.qty * p.price) AS total, count(DISTINCT order_no) AS paid_orders
+                FROM pay
+                INNER JOIN contains AS c USING(order_no)
+                INNER JOIN product AS p USING(SKU)
+                WHERE pay.cust_no = ANY(customers)
+                GROUP BY pay.cust_no
+            ), removed AS (
+                DELETE FROM customer_value
+                WHERE cust_no = ANY(customers) AND cust_no NOT IN (SELECT cust_no FROM totals)
+            )
+            INSERT INTO customer_value SELECT * FROM totals
+                ON CONFLICT (cust_no) DO UPDATE
+                    SET total = EXCLUDED.total, paid_orders = EXCLUDED.paid_orders
+                    WHERE (customer_value.total, customer_value.paid_orders)
+                        IS DISTINCT FROM (EXCLUDED.total, EXCLUDED.paid_orders);
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION customer_value_pay_trigger() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM refresh_customer_value(ARRAY(SELECT DISTINCT cust_no FROM new_pay));
+            END IF;
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                PERFORM refresh_customer_value(ARRAY(SELECT DISTINCT cust_no FROM old_pay));
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS customer_value_pay_insert ON pay;
+        CREATE TRIGGER customer_value_pay_insert AFTER INSERT ON pay
+            REFERENCING NEW TABLE AS new_pay
+            FOR EACH STATEMENT EXECUTE FUNCTION customer_value_pay_trigger();
+
+        DROP TRIGGER IF EXISTS customer_value_pay_update ON pay;
+        CREATE TRIGGER customer_value_pay_update AFTER UPDATE ON pay
+            REFERENCING OLD TABLE AS old_pay NEW TABLE AS new_pay
+            FOR EACH STATEMENT EXECUTE FUNCTION customer_value_pay_trigger();
+
+        DROP TRIGGER IF EXISTS customer_value_pay_delete ON pay;
+        CREATE TRIGGER customer_value_pay_delete AFTER DELETE ON pay
+            REFERENCING OLD TABLE AS old_pay
+            FOR EACH STATEMENT EXECUTE FUNCTION customer_value_pay_trigger();
+
+        --lines of paid orders; a payment deleted by the same statement is seen by
+        --customer_value_pay_delete instead
+        CREATE OR REPLACE FUNCTION customer_value_contains_trigger() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM refresh_customer_value(ARRAY(
+                    SELECT DISTINCT cust_no FROM pay WHERE order_no IN (SELECT order_no FROM new_lines)
+                ));
+            END IF;
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                PERFORM refresh_customer_value(ARRAY(
+                    SELECT DISTINCT cust_no FROM pay WHERE order_no IN (SELECT order_no FROM old_lines)
+                ));
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS customer_value_contains_insert ON contains;
+        CREATE TRIGGER customer_value_contains_insert AFTER INSERT ON contains
+            REFERENCING NEW TABLE AS new_lines
+            FOR EACH STATEMENT EXECUTE FUNCTION customer_value_contains_trigger();
+
+        DROP TRIGGER IF EXISTS customer_value_contains_update ON contains;
+        CREATE TRIGGER customer_value_contains_update AFTER UPDATE ON contains
+            REFERENCING OLD TABLE AS old_lines NEW TABLE AS new_lines
+            FOR EACH STATEMENT EXECUTE FUNCTION customer_value_contains_trigger();
+
+        DROP TRIGGER IF EXISTS customer_value_contains_delete ON contains;
+        CREATE TRIGGER customer_value_contains_delete AFTER DELETE ON contains
+            REFERENCING OLD TABLE AS old_lines
+            FOR EACH STATEMENT EXECUTE FUNCTION customer_value_contains_trigger();
+
+        --a new price changes the value of every paid line of the product
+        CREATE OR REPLACE FUNCTION customer_value_price_trigger() RETURNS TRIGGER AS $$
+        BEGIN
+            PERFORM lock_customer_value(ARRAY(
+                SELECT DISTINCT pay.cust_no
+                FROM old_product AS o
+                INNER JOIN new_product AS n USING(SKU)
+                INNER JOIN contains AS c USING(SKU)
+                INNER JOIN pay USING(order_no)
+                WHERE n.price <> o.price
+            ));
+            UPDATE customer_value AS v SET total = v.total + d.difference
+            FROM (
+                SELECT pay.cust_no, SUM(c.qty * (n.price - o.price)) AS difference
+                FROM old_product AS o
+                INNER JOIN new_product AS n USING(SKU)
+                INNER JOIN contains AS c USING(SKU)
+                INNER JOIN pay USING(order_no)
+                WHERE n.price <> o.price
+                GROUP BY pay.cust_no
+            ) AS d
+            WHERE v.cust_no = d.cust_no;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS customer_value_price ON product;
+        CREATE TRIGGER customer_value_price AFTER UPDATE ON product
+            REFERENCING OLD TABLE AS old_product NEW TABLE AS new_product
+            FOR EACH STATEMENT EXECUTE FUNCTION customer_value_price_trigger();
+
+        --recomputes customer_value from scratch (backfills)
+        CREATE OR REPLACE FUNCTION rebuild_customer_value() RETURNS BIGINT AS $$
+        DECLARE
+            total BIGINT;
+        BEGIN
+            TRUNCATE customer_value;
+            INSERT INTO customer_value
+                SELECT pay.cust_no, SUM(c.qty * p.price), count(DISTINCT order_no)
+                FROM pay
+                INNER JOIN contains AS c USING(order_no)
+                INNER JOIN product AS p USING(SKU)
+                GROUP BY pay.cust_no;
+            GET DIAGNOSTICS total = ROW_COUNT;
+            RETURN total;
+        END
+        $$ LANGUAGE plpgsql;
+        """,
+        "SELECT rebuild_customer_value();",
+        "ANALYZE customer_value;",
+    )),
+    # versions of the tables of the list pages, as in "create all tables.sql",
+    # with table_version itself for the databases older than it. One
+    # transaction, which can be run again
+    (7, "list table versions", (
+        """
+        --version of a table, bumped by every statement that changes it, so caches
+        --of its content know when to recompute
+        CREATE TABLE IF NOT EXISTS table_version(
+            table_name VARCHAR PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 1,
+            changed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+        );
+
+        --the row of the table is locked until commit, so writers of the same table
+        --take turns from here on; statements that changed no row skip it
+        CREATE OR REPLACE FUNCTION bump_table_version() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP <> 'TRUNCATE' THEN
+                IF NOT EXISTS (SELECT FROM changed_rows) THEN
+                    RETURN NULL;
+                END IF;
+            END IF;
+            INSERT INTO table_version (table_name) VALUES (TG_TABLE_NAME)
+                ON CONFLICT (table_name) DO UPDATE
+                    SET version = table_version.version + 1, changed_at = now();
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        --(re)creates the triggers bumping the version of a table: one per kind of
+        --statement, as a trigger with a transition table (changed_rows) can only
+        --have one event
+        CREATE OR REPLACE FUNCTION create_version_triggers(target VARCHAR) RETURNS VOID AS $$
+        DECLARE
+            event VARCHAR;
+        BEGIN
+            EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', target || '_version', target);
+            FOREACH event IN ARRAY ARRAY['insert', 'update', 'delete', 'truncate'] LOOP
+                EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', target || '_version_' || event, target);
+            END LOOP;
+            EXECUTE format(
+                'CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS changed_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()',
+                target || '_version_insert', target
+            );
+            EXECUTE format(
+                'CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING NEW TABLE AS changed_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()',
+                target || '_version_update', target
+            );
+            EXECUTE format(
+                'CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS changed_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()',
+                target || '_version_delete', target
+            );
+            EXECUTE format(
+                'CREATE TRIGGER %I AFTER TRUNCATE ON %I
+                    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()',
+                target || '_version_truncate', target
+            );
+        END
+        $$ LANGUAGE plpgsql;
+
+        --product_sales for the reports (app/reports.py), the tables of the app's list
+        --pages for their cached pages (app/response_cache.py)
+        INSERT INTO table_version (table_name) VALUES
+            ('product_sales'),
+            ('customer'),
+            ('product'),
+            ('supplier'),
+            ('orders'),
+            ('pay'),
+            ('contains')
+            ON CONFLICT (table_name) DO NOTHING;
+
+        --product_sales only once it is a table (migration 8), not the view it was
+        SELECT create_version_triggers(name)
+        FROM unnest(ARRAY['product_sales', 'customer', 'product', 'supplier', 'orders', 'pay', 'contains']) AS name
+        WHERE (SELECT relkind FROM pg_class WHERE oid = to_regclass(name)) = 'r';
+        """,
+    )),
+    # the schema changes made in "create all tables.sql" before there were
+    # migrations, for the databases created before them. Each is one
+    # transaction, which can be run again
+    (8, "product sales summary", (
+        """
+        --product_sales was a view before it was kept up to date as a table
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT FROM pg_class WHERE oid = to_regclass('product_sales') AND relkind = 'v') THEN
+                DROP VIEW product_sales;
+            END IF;
+        END
+        $$;
+
+        --city of an address: what follows the postal code of its second part
+        CREATE OR REPLACE FUNCTION city (address VARCHAR) RETURNS VARCHAR AS $$
+            SELECT substring((string_to_array(address, ', '))[2] from 10);
+        $$ LANGUAGE sql IMMUTABLE;
+
+        --city of every customer, computed once when its address is written
+        CREATE TABLE IF NOT EXISTS customer_city(
+            cust_no INTEGER PRIMARY KEY REFERENCES customer ON UPDATE CASCADE ON DELETE CASCADE,
+            city VARCHAR(255)
+        );
+
+        --the product_sales rows as computed from the base tables
+        CREATE OR REPLACE VIEW product_sales_source AS
+        SELECT p.SKU,
+            o.order_no,
+            c.qty,
+            (c.qty * p.price) AS total_price,
+            EXTRACT(YEAR FROM o.date) AS year,
+            EXTRACT(MONTH FROM o.date) AS month,
+            EXTRACT(DAY FROM o.date) AS day_of_month,
+            EXTRACT(DOW FROM o.date) AS day_of_week,
+            cc.city
+        FROM customer_city AS cc
+        INNER JOIN pay USING(cust_no)
+        INNER JOIN orders AS o USING(order_no)
+        INNER JOIN contains AS c USING(order_no)
+        INNER JOIN product AS p USING(SKU);
+
+        --product_sales materialized, kept up to date by the triggers below
+        CREATE TABLE IF NOT EXISTS product_sales AS
+            SELECT * FROM product_sales_source WITH NO DATA;
+
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT FROM pg_constraint WHERE conrelid = 'product_sales'::regclass AND contype = 'p') THEN
+                ALTER TABLE product_sales ADD PRIMARY KEY (order_no, SKU);
+            END IF;
+        END
+        $$;
+
+        CREATE INDEX IF NOT EXISTS product_sales_sku_idx ON product_sales(SKU);
+
+        CREATE INDEX IF NOT EXISTS product_sales_year_idx ON product_sales(year, SKU);
+
+        CREATE OR REPLACE FUNCTION customer_city_trigger() RETURNS TRIGGER AS $$
+        BEGIN
+            INSERT INTO customer_city VALUES (NEW.cust_no, city(NEW.address))
+                ON CONFLICT (cust_no) DO UPDATE SET city = EXCLUDED.city;
+            IF TG_OP = 'UPDATE' THEN
+                UPDATE product_sales SET city = city(NEW.address)
+                WHERE order_no IN (SELECT order_no FROM pay WHERE cust_no = NEW.cust_no);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS customer_city ON customer;
+        CREATE TRIGGER customer_city AFTER INSERT OR UPDATE OF address ON customer
+            FOR EACH ROW EXECUTE FUNCTION customer_city_trigger();
+
+        CREATE OR REPLACE FUNCTION product_sales_pay_trigger() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                DELETE FROM product_sales WHERE order_no = OLD.order_no;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO product_sales
+                    SELECT * FROM product_sales_source WHERE order_no = NEW.order_no;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS product_sales_pay ON pay;
+        CREATE TRIGGER product_sales_pay AFTER INSERT OR UPDATE OR DELETE ON pay
+            FOR EACH ROW EXECUTE FUNCTION product_sales_pay_trigger();
+
+        CREATE OR REPLACE FUNCTION product_sales_contains_trigger() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                DELETE FROM product_sales WHERE order_no = OLD.order_no AND SKU = OLD.SKU;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO product_sales
+                    SELECT * FROM product_sales_source WHERE order_no = NEW.order_no AND SKU = NEW.SKU;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS product_sales_contains ON contains;
+        CREATE TRIGGER product_sales_contains AFTER INSERT OR UPDATE OR DELETE ON contains
+            FOR EACH ROW EXECUTE FUNCTION product_sales_contains_trigger();
+
+        CREATE OR REPLACE FUNCTION product_sales_orders_trigger() RETURNS TRIGGER AS $$
+        BEGIN
+            DELETE FROM product_sales WHERE order_no = OLD.order_no;
+            INSERT INTO product_sales
+                SELECT * FROM product_sales_source WHERE order_no = NEW.order_no;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS product_sales_orders ON orders;
+        CREATE TRIGGER product_sales_orders AFTER UPDATE OF order_no, date ON orders
+            FOR EACH ROW EXECUTE FUNCTION product_sales_orders_trigger();
+
+        CREATE OR REPLACE FUNCTION product_sales_price_trigger() RETURNS TRIGGER AS $$
+        BEGIN
+            UPDATE product_sales SET total_price = qty * NEW.price WHERE SKU = NEW.SKU;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS product_sales_price ON product;
+        CREATE TRIGGER product_sales_price AFTER UPDATE OF price ON product
+            FOR EACH ROW EXECUTE FUNCTION product_sales_price_trigger();
+
+        --recomputes customer_city and product_sales from scratch (backfills)
+        CREATE OR REPLACE FUNCTION rebuild_product_sales() RETURNS BIGINT AS $$
+        DECLARE
+            total BIGINT;
+        BEGIN
+            INSERT INTO customer_city SELECT cust_no, city(address) FROM customer
+                ON CONFLICT (cust_no) DO UPDATE SET city = EXCLUDED.city;
+            TRUNCATE product_sales;
+            INSERT INTO product_sales SELECT * FROM product_sales_source;
+            GET DIAGNOSTICS total = ROW_COUNT;
+            RETURN total;
+        END
+        $$ LANGUAGE plpgsql;
+
+        INSERT INTO table_version (table_name) VALUES ('product_sales')
+            ON CONFLICT (table_name) DO NOTHING;
+
+        SELECT create_version_triggers('product_sales');
+        """,
+        "SELECT rebuild_product_sales();",
+        "ANALYZE product_sales;",
+    )),
+    (9, "catalog notifications", (
+        """
+        --tells the app's catalog cache (app/catalog.py) which table changed; sent on
+        --commit, once per table and transaction however many statements ran
+        CREATE OR REPLACE FUNCTION notify_catalog() RETURNS TRIGGER AS $$
+        BEGIN
+            PERFORM pg_notify('catalog', TG_TABLE_NAME);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS product_catalog ON product;
+        CREATE TRIGGER product_catalog AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON product
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog();
+
+        DROP TRIGGER IF EXISTS customer_catalog ON customer;
+        CREATE TRIGGER customer_catalog AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON customer
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog();
+        """,
+    )),
+    (10, "set-based integrity checks", (
+        """
+        --the row-level constraint triggers they replace
+        DROP TRIGGER IF EXISTS verifica_workplace ON workplace;
+        DROP TRIGGER IF EXISTS verifica_order ON orders;
+
+        DROP TRIGGER IF EXISTS verifica_workplace_insert ON workplace;
+        DROP TRIGGER IF EXISTS verifica_workplace_update ON workplace;
+
+        --checks every workplace a statement wrote at once, at the end of the statement,
+        --with anti-joins of its rows (new_workplace) against office and warehouse
+        CREATE OR REPLACE FUNCTION verifica_workplace_trigger() RETURNS TRIGGER AS $$
+        DECLARE
+            workplace_address VARCHAR;
+        BEGIN
+            IF EXISTS (
+                SELECT FROM new_workplace
+                    INNER JOIN office USING (address)
+                    INNER JOIN warehouse USING (address)
+            ) THEN
+               RAISE EXCEPTION 'Um Workplace não pode ser Office e Warehouse ao mesmo tempo.';
+            END IF;
+            SELECT address INTO workplace_address FROM new_workplace
+            WHERE NOT EXISTS (SELECT FROM office WHERE office.address = new_workplace.address)
+                AND NOT EXISTS (SELECT FROM warehouse WHERE warehouse.address = new_workplace.address)
+            LIMIT 1;
+            IF FOUND THEN
+                RAISE EXCEPTION 'O Workplace % tem de ser obrigatoriamente Office ou Warehouse.', workplace_address;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER verifica_workplace_insert AFTER INSERT ON workplace
+            REFERENCING NEW TABLE AS new_workplace
+            FOR EACH STATEMENT EXECUTE FUNCTION verifica_workplace_trigger();
+
+        CREATE TRIGGER verifica_workplace_update AFTER UPDATE ON workplace
+            REFERENCING NEW TABLE AS new_workplace
+            FOR EACH STATEMENT EXECUTE FUNCTION verifica_workplace_trigger();
+
+        DROP TRIGGER IF EXISTS verifica_order_insert ON orders;
+        DROP TRIGGER IF EXISTS verifica_order_update ON orders;
+
+        --checks every order a statement wrote at once, at the end of the statement,
+        --with an anti-join of its rows (new_orders) against contains
+        CREATE OR REPLACE FUNCTION verifica_order_trigger() RETURNS TRIGGER AS $$
+        DECLARE
+            missing_order_no INTEGER;
+        BEGIN
+            SELECT order_no INTO missing_order_no FROM new_orders
+            WHERE NOT EXISTS (SELECT FROM contains WHERE contains.order_no = new_orders.order_no)
+            LIMIT 1;
+            IF FOUND THEN
+               RAISE EXCEPTION 'O order_no % tem de estar obrigatoriamente Contains.', missing_order_no;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER verifica_order_insert AFTER INSERT ON orders
+            REFERENCING NEW TABLE AS new_orders
+            FOR EACH STATEMENT EXECUTE FUNCTION verifica_order_trigger();
+
+        CREATE TRIGGER verifica_order_update AFTER UPDATE ON orders
+            REFERENCING NEW TABLE AS new_orders
+            FOR EACH STATEMENT EXECUTE FUNCTION verifica_order_trigger();
+        """,
+    )),
+    # the versions bumped once per transaction, at commit, in a fixed order,
+    # instead of by every statement as it runs. One transaction, which can be
+    # run again
+    (11, "commit-time table versions", (
+        """
+        --one row per transaction that changed a versioned table, whose deferred trigger
+        --bumps the versions of the tables it changed when it commits
+        CREATE UNLOGGED TABLE IF NOT EXISTS table_version_commit(
+            xact_id XID8 NOT NULL DEFAULT pg_current_xact_id()
+        );
+
+        --statements that changed no row skip it; the others only add their table to the
+        --ones of the transaction (table_version.changed), so writers lock no version
+        --row until they commit
+        CREATE OR REPLACE FUNCTION bump_table_version() RETURNS TRIGGER AS $$
+        DECLARE
+            changed VARCHAR := current_setting('table_version.changed', true);
+        BEGIN
+            IF TG_OP <> 'TRUNCATE' THEN
+                IF NOT EXISTS (SELECT FROM changed_rows) THEN
+                    RETURN NULL;
+                END IF;
+            END IF;
+            IF COALESCE(changed, '') = '' THEN
+                INSERT INTO table_version_commit DEFAULT VALUES;
+            ELSIF TG_TABLE_NAME = ANY(string_to_array(changed, ',')) THEN
+                RETURN NULL;
+            END IF;
+            PERFORM set_config('table_version.changed', concat_ws(',', NULLIF(changed, ''), TG_TABLE_NAME), true);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        --at commit, the versions of every table the transaction changed, their rows
+        --locked in the order of their names: transactions writing several tables in
+        --different orders cannot deadlock on them, and hold them only while committing.
+        --changed_at never goes back, so a page read while the transaction ran is older
+        CREATE OR REPLACE FUNCTION commit_table_versions() RETURNS TRIGGER AS $$
+        DECLARE
+            changed VARCHAR[] := string_to_array(current_setting('table_version.changed', true), ',');
+        BEGIN
+            PERFORM set_config('table_version.changed', '', true);
+            DELETE FROM table_version_commit WHERE xact_id = pg_current_xact_id();
+            PERFORM FROM table_version WHERE table_name = ANY(changed) ORDER BY table_name FOR NO KEY UPDATE;
+            INSERT INTO table_version (table_name) SELECT name FROM unnest(changed) AS name ORDER BY name
+                ON CONFLICT (table_name) DO UPDATE
+                    SET version = table_version.version + 1,
+                        changed_at = GREATEST(table_version.changed_at, clock_timestamp());
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS table_version_commit ON table_version_commit;
+
+        CREATE CONSTRAINT TRIGGER table_version_commit AFTER INSERT ON table_version_commit
+            DEFERRABLE INITIALLY DEFERRED
+            FOR EACH ROW EXECUTE FUNCTION commit_table_versions();
+        """,
+    )),
+)
+
+# pg_advisory_lock key, so two runners do not apply the same version
+LOCK_KEY = 1401
+
+
+class MigrationError(Exception):
+    pass
+
+
+def applied_versions(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations(
+            version INTEGER PRIMARY KEY,
+            name VARCHAR NOT NULL,
+            applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+        );
+        """
+    )
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations;")}
+
+
+def pending_migrations(conn):
+    applied = applied_versions(conn)
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def create_index(conn, name, definition):
+    # a CONCURRENTLY build that was interrupted leaves an invalid index
+    # behind, which IF NOT EXISTS would take as done
+    invalid = conn.execute(
+        """
+        SELECT FROM pg_index
+        WHERE indexrelid = to_regclass(%(name)s) AND NOT indisvalid;
+        """,
+        {"name": name},
+    ).fetchone()
+    if invalid:
+        conn.execute(sql.SQL("DROP INDEX CONCURRENTLY {};").format(sql.Identifier(name)))
+    conn.execute(
+        sql.SQL("CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {};").format(
+            sql.Identifier(name), sql.SQL(definition)
+        )
+    )
+
+
+def apply_migration(conn, migration):
+    version, name, steps = migration
+    for step in steps:
+        if isinstance(step, tuple):
+            create_index(conn, *step)
+        else:
+            conn.execute(step)
+    conn.execute(
+        """
+        INSERT INTO schema_migrations (version, name) VALUES (%(version)s, %(name)s);
+        """,
+        {"version": version, "name": name},
+    )
+
+
+def migrate(conninfo, log=print):
+    """
+    Applies the migrations the database does not have yet, oldest first, and
+    returns their versions.
+    Runs in autocommit, as CREATE INDEX CONCURRENTLY cannot be run inside a
+    transaction: a version is recorded once all its steps are done, and
+    every step can be run again, so a failed run is resumed by the next.
+    """
+    done = []
+    with psycopg.connect(conninfo, autocommit=True) as conn:
+        conn.execute("SELECT pg_advisory_lock(%s);", (LOCK_KEY,))
+        try:
+            for migration in pending_migrations(conn):
+                log(f"Applying {migration[0]}: {migration[1]}")
+                try:
+                    apply_migration(conn, migration)
+                except psycopg.Error as e:
+                    raise MigrationError(f"Migration {migration[0]} failed: {e}") from e
+                done.append(migration[0])
+        finally:
+            conn.execute("SELECT pg_advisory_unlock(%s);", (LOCK_KEY,))
+    return done
@@ -0,0 +1,106 @@
+import json
+from datetime import datetime
+
+from queries import execute
+
+
+ORDER_ERRORS = (
+    "Order Number is required.",
+    "Customer Number is required.",
+    "Date is required.",
+    "Order Number must be integer.",
+    "\tInvalid Date.\nDate format must be YYYY-MM-DD",
+    "Order number already exists",
+    "Quantity must be integer.",
+    "Order must include a product.",
+    "Customer Number does not exist.",
+    "Product SKU does not exist.",
+    "Quantity must be positive.",
+    "Invalid order line.",
+)
+
+
+class OrderError(Exception):
+    pass
+
+
+def order_header(order_no, cust_no, date):
+    """Checks the order fields, in the order the form asks for them."""
+    if not order_no:
+        raise OrderError(ORDER_ERRORS[0])
+    if not cust_no:
+        raise OrderError(ORDER_ERRORS[1])
+    if not date:
+        raise OrderError(ORDER_ERRORS[2])
+    try:
+        int(order_no)
+    except (TypeError, ValueError):
+        raise OrderError(ORDER_ERRORS[3])
+    try:
+        datetime.strptime(str(date), "%Y-%m-%d")
+    except ValueError:
+        raise OrderError(ORDER_ERRORS[4])
+    return {"order_no": order_no, "cust_no": cust_no, "date": date}
+
+
+def order_lines(lines):
+    """
+    Quantity of every SKU of (sku, qty) pairs: empty and zero quantities are
+    left out and a SKU given twice gets the sum of its quantities.
+    """
+    basket = {}
+    for sku, qty in lines:
+        if qty is None or qty == "":
+            continue
+        try:
+            qty = int(qty)
+        except (TypeError, ValueError):
+            raise OrderError(ORDER_ERRORS[6])
+        if qty < 0:
+            raise OrderError(ORDER_ERRORS[10])
+        if qty:
+            basket[sku] = basket.get(sku, 0) + qty
+    if not basket:
+        raise OrderError(ORDER_ERRORS[7])
+    return basket
+
+
+def parse_lines(text):
+    """
+    (sku, qty) pairs of a JSON lines submission, one {"sku": ..., "qty": ...}
+    object per line.
+    """
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            line = json.loads(line)
+            yield str(line["sku"]), line["qty"]
+        except (ValueError, TypeError, KeyError):
+            raise OrderError(ORDER_ERRORS[11])
+
+
+def parse_order(text):
+    """
+    Header and basket of a JSON lines order: the first line holds order_no,
+    cust_no and date, every other line one {"sku": ..., "qty": ...}.
+    """
+    header, _, lines = text.lstrip().partition("\n")
+    try:
+        header = json.loads(header)
+        header = order_header(header.get("order_no"), header.get("cust_no"), header.get("date"))
+    except (ValueError, AttributeError):
+        raise OrderError(ORDER_ERRORS[11])
+    return header, order_lines(parse_lines(lines))
+
+
+def insert_order(cur, header, basket):
+    execute(
+        cur,
+        "insert_order",
+        {
+            **header,
+            "skus": list(basket),
+            "qtys": list(basket.values()),
+        },
+    )
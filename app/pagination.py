@@ -0,0 +1,125 @@
+import os
+
+from flask import request
+from flask import url_for
+from psycopg import sql
+
+
+# rows per page when the list views are not asked for a specific ?size=
+PAGE_SIZE = int(os.environ.get("PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", "1000"))
+# rows fetched per round trip by the server-side cursor of the ?all=1 mode
+STREAM_CHUNK = int(os.environ.get("STREAM_CHUNK", "2000"))
+# the arguments of the pages; the others (filters) are kept by their links
+PAGE_ARGS = ("size", "after", "before", "all")
+
+
+def page_args(args, key):
+    """
+    Size and starting key of the page asked for by the ?size=, ?after= and
+    ?before= arguments (a key is given as one argument per key column).
+    """
+    try:
+        size = int(args.get("size", PAGE_SIZE))
+    except ValueError:
+        size = PAGE_SIZE
+    size = max(1, min(size, MAX_PAGE_SIZE))
+    after = args.getlist("after")
+    before = args.getlist("before")
+    if len(after) != len(key):
+        after = None
+    if len(before) != len(key):
+        before = None
+    return size, after, before
+
+
+def key_of(record, key):
+    return [getattr(record, column) for column in key]
+
+
+def page_url(**args):
+    kept = {name: values for name, values in request.args.lists() if name not in PAGE_ARGS}
+    return url_for(request.endpoint, **(request.view_args or {}), **{**kept, **args})
+
+
+def all_rows_query(table, key, where=None):
+    """Every row of table (that where, of filter_condition, selects) by key, and its params."""
+    query = sql.SQL("SELECT * FROM {table}").format(table=sql.Identifier(table))
+    params = []
+    if where is not None:
+        query += sql.SQL(" WHERE {where}").format(where=where[0])
+        params = list(where[1])
+    return query + sql.SQL(" ORDER BY {order}").format(
+        order=sql.SQL(", ").join(map(sql.Identifier, key)),
+    ), params
+
+
+def page_query(table, key, size, after=None, before=None, where=None):
+    """
+    Keyset query over the primary key of a table: only the rows after (or
+    before) the given key are read, so every page costs one index range scan
+    no matter how deep into the table it is.
+    where is an extra condition (the filters of the page, as filter_condition
+    returns them: the condition and its values), if any.
+    Asks for size + 1 rows to know if there is another page.
+    """
+    columns = sql.SQL(", ").join(map(sql.Identifier, key))
+    placeholders = sql.SQL(", ").join(sql.Placeholder() * len(key))
+    query = sql.SQL("SELECT * FROM {table}").format(table=sql.Identifier(table))
+    conditions = [] if where is None else [where[0]]
+    params = [] if where is None else list(where[1])
+    if before:
+        conditions.append(sql.SQL("({columns}) < ({values})").format(columns=columns, values=placeholders))
+        order = sql.SQL(", ").join(sql.SQL("{} DESC").format(sql.Identifier(c)) for c in key)
+        params += before
+    elif after:
+        conditions.append(sql.SQL("({columns}) > ({values})").format(columns=columns, values=placeholders))
+        order = columns
+        params += after
+    else:
+        order = columns
+    if conditions:
+        query += sql.SQL(" WHERE {}").format(sql.SQL(" AND ").join(conditions))
+    query += sql.SQL(" ORDER BY {order}").format(order=order)
+    query += sql.SQL(" LIMIT {limit}").format(limit=sql.Literal(size + 1))
+    return query, params
+
+
+def read_page(rows, key, size, after, before, url):
+    """
+    Trims the size + 1 rows read by page_query to the page and builds its
+    previous/next/all links with url(**args).
+    """
+    has_more = len(rows) > size
+    rows = rows[:size]
+    if before:
+        rows.reverse()
+
+    pages = {
+        "previous": None,
+        "next": None,
+        "all": url(all=1),
+    }
+    if rows:
+        if has_more if before else after:
+            pages["previous"] = url(before=key_of(rows[0], key), size=size)
+        if before or has_more:
+            pages["next"] = url(after=key_of(rows[-1], key), size=size)
+    return rows, pages
+
+
+def fetch_page(cur, table, key, where=None):
+    """
+    Reads the page of table selected by the arguments of the current request.
+    Returns the rows and the previous/next/all links for list.html.
+    """
+    size, after, before = page_args(request.args, key)
+    cur.execute(*page_query(table, key, size, after=after, before=before, where=where))
+    return read_page(cur.fetchall(), key, size, after, before, page_url)
+
+
+async def fetch_page_async(cur, table, key, args, url, where=None):
+    """fetch_page for an async cursor, with the request arguments and url builder given."""
+    size, after, before = page_args(args, key)
+    await cur.execute(*page_query(table, key, size, after=after, before=before, where=where))
+    return read_page(await cur.fetchall(), key, size, after, before, url)
@@ -0,0 +1,6 @@
+from batch import run_batch
+
+
+def delete_products(conn, skus):
+    """Deletes every product of skus, and what depends on them, in one transaction."""
+    run_batch(conn, ("delete_products",), {"skus": list(skus)})
@@ -0,0 +1,236 @@
+import os
+import threading
+import weakref
+from time import perf_counter
+
+
+# PREPARED_STATEMENTS=0 runs every statement from its text, as psycopg does
+PREPARED_STATEMENTS = os.environ.get("PREPARED_STATEMENTS", "1") != "0"
+
+# names for EXTRACT(MONTH/DOW ...) without a function call per row
+MONTH = "(ARRAY['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December'])[month::INTEGER]"
+DAY_OF_WEEK = "(ARRAY['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday'])[day_of_week::INTEGER + 1]"
+
+# every statement of the app with a fixed text, by name. The queries built
+# per table (pages, exports, imports) are not here: psycopg prepares those
+# by itself once they run a few times on a connection.
+STATEMENTS = {
+    "insert_customer": """
+        INSERT INTO customer (cust_no, name, email, phone, address)
+        VALUES (%(cust_no)s, %(name)s, %(email)s, %(phone)s, %(address)s);
+        """,
+    "delete_customer_process": """
+        DELETE FROM process WHERE order_no IN (
+            SELECT order_no FROM process INNER JOIN orders USING(order_no) WHERE cust_no = %(cust_no)s
+        );
+        """,
+    "delete_customer_contains": """
+        DELETE FROM contains WHERE order_no IN (
+            SELECT order_no FROM contains INNER JOIN orders USING(order_no) WHERE cust_no = %(cust_no)s
+        );
+        """,
+    "delete_customer_pay": """
+        DELETE FROM pay WHERE cust_no = %(cust_no)s;
+        """,
+    "delete_customer_orders": """
+        DELETE FROM orders WHERE cust_no = %(cust_no)s;
+        """,
+    "delete_customer": """
+        DELETE FROM customer WHERE cust_no = %(cust_no)s;
+        """,
+    # the unpaid orders of a customer with what each costs, in one read
+    "customer_pending": """
+        SELECT o.order_no, o.date, SUM(c.qty * p.price) AS amount
+        FROM orders AS o
+        INNER JOIN contains AS c USING(order_no)
+        INNER JOIN product AS p USING(SKU)
+        WHERE o.cust_no = %(cust_no)s
+            AND NOT EXISTS (SELECT FROM pay WHERE pay.order_no = o.order_no)
+        GROUP BY o.order_no
+        ORDER BY o.date, o.order_no;
+        """,
+    "insert_pay": """
+        INSERT INTO pay (order_no, cust_no) VALUES (%(order_no)s, %(cust_no)s);
+        """,
+    "insert_product": """
+        INSERT INTO product (sku, name, description, price, ean)
+        VALUES (%(sku)s, %(name)s, %(description)s, %(price)s, %(ean)s);
+        """,
+    # an empty description keeps the current one
+    "update_product": """
+        UPDATE product SET price = %(price)s, description = COALESCE(%(description)s, description)
+        WHERE sku = %(sku)s;
+        """,
+    # removes products with everything that depends on them, in one statement:
+    # only the orders that had one of the SKUs are looked at, and of those only
+    # the ones left without any product are deleted (with their pay and process).
+    # Every part of the statement sees the rows as they were before it, so the
+    # remaining lines of an order are the ones with a SKU not being deleted.
+    "delete_products": """
+        WITH removed_lines AS (
+            DELETE FROM contains WHERE sku = ANY(%(skus)s::VARCHAR[])
+            RETURNING order_no
+        ), emptied AS (
+            SELECT DISTINCT order_no FROM removed_lines
+            WHERE NOT EXISTS (
+                SELECT FROM contains
+                WHERE contains.order_no = removed_lines.order_no
+                    AND contains.sku <> ALL(%(skus)s::VARCHAR[])
+            )
+        ), removed_process AS (
+            DELETE FROM process WHERE order_no IN (SELECT order_no FROM emptied)
+        ), removed_pay AS (
+            DELETE FROM pay WHERE order_no IN (SELECT order_no FROM emptied)
+        ), removed_orders AS (
+            DELETE FROM orders WHERE order_no IN (SELECT order_no FROM emptied)
+        ), removed_suppliers AS (
+            DELETE FROM supplier WHERE sku = ANY(%(skus)s::VARCHAR[])
+            RETURNING tin
+        ), removed_deliveries AS (
+            DELETE FROM delivery WHERE tin IN (SELECT tin FROM removed_suppliers)
+        )
+        DELETE FROM product WHERE sku = ANY(%(skus)s::VARCHAR[]);
+        """,
+    "insert_supplier": """
+        INSERT INTO supplier (tin, name, address, sku, date)
+        VALUES (%(tin)s, %(name)s, %(address)s, %(sku)s, %(date)s);
+        """,
+    "delete_supplier_deliveries": """
+        DELETE FROM delivery WHERE tin = %(tin)s;
+        """,
+    "delete_supplier": """
+        DELETE FROM supplier WHERE tin = %(tin)s;
+        """,
+    # the order and all its contains lines in one statement: the lines travel
+    # as two arrays, whatever the size of the basket
+    "insert_order": """
+        WITH lines AS (
+            INSERT INTO contains (order_no, sku, qty)
+            SELECT %(order_no)s::INTEGER, line.sku, line.qty
+            FROM unnest(%(skus)s::VARCHAR[], %(qtys)s::INTEGER[]) AS line(sku, qty)
+        )
+        INSERT INTO orders (order_no, cust_no, date) VALUES (%(order_no)s, %(cust_no)s, %(date)s);
+        """,
+    "order_products": """
+        SELECT sku, name, qty, price
+        FROM contains INNER JOIN product USING(sku)
+        WHERE order_no=%(order_no)s ORDER BY name;
+        """,
+    "catalog_product": """
+        SELECT sku, name, price FROM product ORDER BY name, sku;
+        """,
+    "catalog_customer": """
+        SELECT cust_no FROM customer ORDER BY cust_no;
+        """,
+    "table_versions": """
+        SELECT table_name, version, changed_at FROM table_version
+        WHERE table_name = ANY(%(tables)s::VARCHAR[]);
+        """,
+    "product_sales_version": """
+        SELECT version FROM table_version WHERE table_name = 'product_sales';
+        """,
+    "rebuild_product_sales": """
+        SELECT rebuild_product_sales();
+        """,
+    "rebuild_customer_value": """
+        SELECT rebuild_customer_value();
+        """,
+    # customer_value_total_idx read from the top: n rows whatever the history
+    "top_customers": """
+        SELECT v.cust_no, c.name, v.total, v.paid_orders
+        FROM customer_value AS v INNER JOIN customer AS c USING(cust_no)
+        ORDER BY v.total DESC, v.cust_no
+        LIMIT %(n)s;
+        """,
+    # the OLAP queries of the E3 report, over one year of product_sales
+    "report_sales": f"""
+        SELECT SUM(qty) AS total_qty,
+            SUM(total_price) AS total_price,
+            sku,
+            city,
+            {MONTH} AS month,
+            day_of_month,
+            {DAY_OF_WEEK} AS day_of_week
+        FROM product_sales
+        WHERE year = %(year)s
+        GROUP BY GROUPING SETS ((sku), (sku, city), (sku, month), (sku, day_of_month), (sku, day_of_week))
+        ORDER BY sku, city, product_sales.month, day_of_month, product_sales.day_of_week;
+        """,
+    "report_daily_average": f"""
+        SELECT AVG(total_price) AS daily_average,
+            sku,
+            {MONTH} AS month,
+            {DAY_OF_WEEK} AS day_of_week
+        FROM product_sales
+        WHERE year = %(year)s
+        GROUP BY GROUPING SETS ((sku), (sku, month), (sku, day_of_week))
+        ORDER BY sku, product_sales.month, product_sales.day_of_week;
+        """,
+}
+
+# the connections of the pool, which prepare the statements on their first
+# run; the others (CGI, or the ones of the CLI) run them from their text
+prepared = weakref.WeakSet()
+
+
+def prepare_on_first_run(conn):
+    """
+    configure callback of the pool: a new connection prepares every
+    statement the first time it runs it (execute passes prepare=True), so
+    the requests after that skip parsing and planning it, and keeps room
+    for them besides the queries psycopg prepares by itself.
+
+    They are not prepared here, when the connection opens: psycopg prepares
+    a statement only by running it, and keys it by the types of the values
+    (int2, int4 or int8 by size, for one), so running the registry with
+    made-up values would write and still miss the statements of the
+    requests. A PREPARE of ours would only be usable through EXECUTE with
+    the values in its text. So the first request running a statement on a
+    connection still parses and plans it.
+    """
+    if not PREPARED_STATEMENTS:
+        return
+    conn.prepared_max += len(STATEMENTS)
+    prepared.add(conn)
+
+
+class Counter:
+    __slots__ = ("calls", "seconds", "rows")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = 0
+
+
+# statement name -> Counter, for the life of the process
+counters = {name: Counter() for name in STATEMENTS}
+lock = threading.Lock()
+
+
+def execute(cur, name, params=None):
+    """
+    Runs the statement name on cur with params bound, as a prepared
+    statement of psycopg when its connection prepares them (from the first
+    run), or as psycopg would otherwise.
+    """
+    query = STATEMENTS[name]
+    prepare = True if cur.connection in prepared else None
+    start = perf_counter()
+    try:
+        return cur.execute(query, params, prepare=prepare)
+    finally:
+        # in a pipeline the time is the one to queue the statement
+        elapsed = perf_counter() - start
+        with lock:
+            counter = counters[name]
+            counter.calls += 1
+            counter.seconds += elapsed
+            counter.rows += max(cur.rowcount, 0)
+
+
+def statement_stats():
+    """(name, calls, seconds, rows) of every statement run, the most time first."""
+    with lock:
+        stats = [(name, c.calls, c.seconds, c.rows) for name, c in counters.items() if c.calls]
+    return sorted(stats, key=lambda stat: -stat[2])
@@ -0,0 +1,40 @@
+import os
+
+from cache import LRUCache
+from queries import execute
+
+
+# rollups kept per process, keyed by report, year and product_sales version
+REPORT_CACHE_SIZE = int(os.environ.get("REPORT_CACHE_SIZE", "64"))
+
+cache = LRUCache(REPORT_CACHE_SIZE)
+
+# the OLAP queries of the E3 report, over one year of product_sales
+REPORTS = {
+    "sales": {
+        "title": "Sales",
+        "colnames": ("total_qty", "total_price", "sku", "city", "month", "day_of_month", "day_of_week"),
+        "statement": "report_sales",
+    },
+    "daily-average": {
+        "title": "Daily Average",
+        "colnames": ("daily_average", "sku", "month", "day_of_week"),
+        "statement": "report_daily_average",
+    },
+}
+
+
+def report_rows(cur, report, year):
+    """
+    Rows of a report for a year: computed once per version of product_sales
+    (which the triggers on pay and contains change), then served from cache.
+    """
+    execute(cur, "product_sales_version")
+    version = cur.fetchone()
+    key = (report, year, version[0] if version else 0)
+    rows = cache.get(key)
+    if rows is None:
+        execute(cur, REPORTS[report]["statement"], {"year": year})
+        rows = cur.fetchall()
+        cache.set(key, rows)
+    return rows
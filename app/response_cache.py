@@ -0,0 +1,118 @@
+import hashlib
+import os
+from functools import wraps
+
+import psycopg
+from flask import Response
+from flask import g
+from flask import make_response
+from flask import request
+from flask import template_rendered
+from psycopg.rows import namedtuple_row
+
+from cache import LRUCache
+from queries import execute
+
+
+# RESPONSE_CACHE=0 renders every page, without ETag nor Last-Modified
+RESPONSE_CACHE = os.environ.get("RESPONSE_CACHE", "1") != "0"
+# bytes of pages kept per process, the least recently used evicted first
+RESPONSE_CACHE_BYTES = int(os.environ.get("RESPONSE_CACHE_BYTES", str(32 * 1024 * 1024)))
+RESPONSE_CACHE_ENTRIES = int(os.environ.get("RESPONSE_CACHE_ENTRIES", "10000"))
+# part of every ETag, so a new release does not answer 304 to the pages of
+# the previous one
+RELEASE = os.environ.get("APP_RELEASE", "")
+
+
+def note_template(sender, template, context, **extra):
+    g.setdefault("templates", []).append(template.name)
+
+
+# strong reference: blinker keeps weak ones by default
+template_rendered.connect(note_template)
+
+
+def table_versions(tables, rows):
+    """
+    (version per table, last change of any) of tables, from their
+    table_version rows: version 0 for a table never written.
+    """
+    rows = {row.table_name: row for row in rows}
+    versions = tuple(rows[table].version if table in rows else 0 for table in tables)
+    changes = [row.changed_at for row in rows.values()]
+    return versions, max(changes) if changes else None
+
+
+def version_tag(endpoint, tables, versions):
+    return hashlib.sha1(repr((RELEASE, endpoint, tables, versions)).encode()).hexdigest()[:20]
+
+
+def is_fresh(request, etag, modified):
+    """Whether the client already has the response tagged etag, last changed at modified."""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    return bool(
+        modified and request.if_modified_since
+        and modified.replace(microsecond=0) <= request.if_modified_since
+    )
+
+
+def tag_response(response, etag, modified):
+    response.set_etag(etag)
+    if modified:
+        response.last_modified = modified
+    # stored by the browser, but asked again (If-None-Match) every time
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+class ResponseCache:
+    """
+    Rendered pages of the views decorated with cached(tables), kept while
+    the table_version of the tables they read stays the same. Every request
+    costs one lookup of those versions, which also answers If-None-Match
+    (and If-Modified-Since) with a 304 without rendering anything.
+    """
+
+    def __init__(self, pool, max_bytes=RESPONSE_CACHE_BYTES, max_entries=RESPONSE_CACHE_ENTRIES):
+        self.pool = pool
+        self.pages = LRUCache(max_entries, max_bytes=max_bytes, size=lambda page: len(page[0]))
+
+    def versions(self, tables):
+        with self.pool.connection() as conn:
+            with conn.cursor(row_factory=namedtuple_row) as cur:
+                execute(cur, "table_versions", {"tables": list(tables)})
+                return table_versions(tables, cur.fetchall())
+
+    def cached(self, *tables):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # the ?all=1 streams are not kept in memory
+                if not RESPONSE_CACHE or request.args.get("all"):
+                    return view(*args, **kwargs)
+                try:
+                    versions, modified = self.versions(tables)
+                except psycopg.Error:
+                    # no table_version (a database not migrated): uncached
+                    return view(*args, **kwargs)
+                etag = version_tag(request.endpoint, tables, versions)
+                if is_fresh(request, etag, modified):
+                    response = Response(status=304)
+                else:
+                    key = (request.full_path, etag)
+                    page = self.pages.get(key)
+                    if page is None:
+                        response = make_response(view(*args, **kwargs))
+                        # error pages (rendered with a 200 by the views) are not kept
+                        if response.status_code != 200 or "error.html" in g.get("templates", ()):
+                            return response
+                        page = (response.get_data(), response.mimetype)
+                        self.pages.set(key, page)
+                    response = Response(page[0], mimetype=page[1])
+
+                return tag_response(response, etag, modified)
+
+            return wrapper
+
+        return decorator
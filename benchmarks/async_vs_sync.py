@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+"""
+Throughput of the sync (gunicorn + wsgi.py) and async (uvicorn + asgi.py)
+ways of serving the app, side by side, on the same routes and database.
+
+    DATABASE_URL=postgres://db:db@localhost/db python benchmarks/async_vs_sync.py --concurrency 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+from http_load import run
+from http_load import wait_for_port
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+SERVERS = {
+    "sync": lambda args, port: [
+        sys.executable, "-m", "gunicorn", "wsgi:app",
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(args.workers),
+        "--threads", str(args.threads),
+    ],
+    "async": lambda args, port: [
+        sys.executable, "-m", "uvicorn", "asgi:app",
+        "--host", "127.0.0.1",
+        "--port", str(port),
+        "--workers", str(args.workers),
+        "--no-access-log",
+    ],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4, help="threads per gunicorn worker")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--path", action="append", dest="paths",
+                        help="route to load (repeatable), defaults to the read routes")
+    args = parser.parse_args()
+    paths = args.paths or [
+        "/customer", "/product", "/orders", "/orders/insert",
+        "/api/v1/customers", "/api/v1/orders",
+    ]
+
+    results = {}
+    for number, (mode, command) in enumerate(SERVERS.items()):
+        port = args.port + number
+        server = subprocess.Popen(command(args, port), cwd=APP_DIR, stderr=subprocess.DEVNULL)
+        try:
+            asyncio.run(wait_for_port("127.0.0.1", port))
+            run("127.0.0.1", port, [("GET", path, b"") for path in paths], 4, 2)  # warm up
+            results[mode] = run(
+                "127.0.0.1", port,
+                [("GET", path, b"") for path in paths],
+                args.concurrency, args.duration,
+            )
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"{'mode':8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for mode, result in results.items():
+        print(f"{mode:8}{result['throughput']:>10}{result['p50_ms'] or 0:>10.1f}"
+              f"{result['p95_ms'] or 0:>10.1f}{result['p99_ms'] or 0:>10.1f}{result['errors']:>8}")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+"""
+Cold start of app.cgi: what importing the app costs, module by module
+(python -X importtime), and the wall-clock time of whole CGI hits, each a
+new python process, with the single direct connection of the CGI mode and
+with the connection pool (DATABASE_POOL=1).
+
+    DATABASE_URL=postgres://db:db@localhost/db python benchmarks/cgi_startup.py --hits 30
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from http_load import percentile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+APP_DIR = os.path.join(ROOT, "app")
+DATABASE_URL = os.environ.get("DATABASE_URL", "postgres://db:db@localhost/db")
+
+# no database, a list, and a form reading the catalog
+ROUTES = ("/", "/customer", "/orders/insert")
+MODES = (("direct", "0"), ("pool", "1"))
+
+
+def cgi_env(path, pool):
+    path, _, query = path.partition("?")
+    return {
+        **os.environ,
+        "DATABASE_URL": DATABASE_URL,
+        "DATABASE_POOL": pool,
+        "GATEWAY_INTERFACE": "CGI/1.1",
+        "REQUEST_METHOD": "GET",
+        "SCRIPT_NAME": "",
+        "PATH_INFO": path,
+        "QUERY_STRING": query,
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+    }
+
+
+def import_times(pool):
+    """(module, cumulative ms) of the modules the app imports directly, and the total."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=APP_DIR, env=cgi_env("/", pool), capture_output=True, text=True, check=True,
+    )
+    modules = []
+    total = None
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0 and name.strip() == "app":
+            total = int(cumulative) / 1000
+        elif depth == 1:
+            modules.append((name.strip(), int(cumulative) / 1000))
+    return sorted(modules, key=lambda module: -module[1]), total
+
+
+def hit(path, pool):
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "app.cgi"], cwd=APP_DIR, env=cgi_env(path, pool), capture_output=True,
+    )
+    elapsed = (time.perf_counter() - start) * 1000
+    status = result.stdout.partition(b"\r\n")[0].decode(errors="replace")
+    ok = result.returncode == 0 and status.startswith("Status: 200") and b"Something went wrong" not in result.stdout
+    return elapsed, ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hits", type=int, default=20, help="CGI runs per route and mode")
+    parser.add_argument("--route", action="append", dest="routes", help="defaults to " + ", ".join(ROUTES))
+    parser.add_argument("--top", type=int, default=12, help="modules listed by import time")
+    args = parser.parse_args()
+
+    for mode, pool in MODES:
+        modules, total = import_times(pool)
+        print(f"import app ({mode}): {total:.1f} ms")
+        for name, ms in modules[:args.top]:
+            print(f"    {name:30}{ms:>8.1f} ms")
+
+    print(f"\n{'route':24}{'mode':>8}{'p50 ms':>10}{'p95 ms':>10}{'min ms':>10}{'errors':>8}")
+    for path in args.routes or ROUTES:
+        for mode, pool in MODES:
+            hit(path, pool)  # warm the page cache and the __pycache__
+            latencies, errors = [], 0
+            for _ in range(args.hits):
+                elapsed, ok = hit(path, pool)
+                latencies.append(elapsed)
+                errors += not ok
+            print(f"{path:24}{mode:>8}{statistics.median(latencies):>10.1f}"
+                  f"{percentile(latencies, 95):>10.1f}{min(latencies):>10.1f}{errors:>8}")
+
+
+if __name__ == "__main__":
+    main()
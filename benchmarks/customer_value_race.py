@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+"""
+Check of the customer_value triggers under concurrent payments: --workers
+connections pay different orders of the same customer at the same time,
+each waiting --hold seconds before its commit so the transactions overlap,
+and customer_value is then compared with the total computed from pay,
+contains and product. Without the lock of refresh_customer_value the last
+transaction to commit overwrites the total with one that misses the others'
+payments. The customer, product and orders are created for the run and
+removed at the end; exits with 1 when a total drifted.
+
+    DATABASE_URL=postgres://db:db@localhost/db python benchmarks/customer_value_race.py --workers 8 --rounds 5
+"""
+import argparse
+import os
+import sys
+import threading
+
+import psycopg
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "postgres://db:db@localhost/db")
+
+EXPECTED = """
+    SELECT COALESCE(SUM(c.qty * p.price), 0), count(DISTINCT order_no)
+    FROM pay
+    INNER JOIN contains AS c USING(order_no)
+    INNER JOIN product AS p USING(SKU)
+    WHERE pay.cust_no = %(cust_no)s;
+    """
+
+
+def setup(conn, orders):
+    """A customer with orders unpaid orders of one line each; returns (cust_no, order numbers)."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT (SELECT COALESCE(max(cust_no), 0) + 1 FROM customer),
+                (SELECT COALESCE(max(order_no), 0) + 1 FROM orders);
+            """
+        )
+        cust_no, first_order = cur.fetchone()
+        order_nos = list(range(first_order, first_order + orders))
+        cur.execute(
+            """
+            INSERT INTO customer (cust_no, name, email, address)
+            VALUES (%(cust_no)s, 'Race Check', %(email)s, 'Rua Nova 1, 1000-001 Lisboa');
+            """,
+            {"cust_no": cust_no, "email": f"race{cust_no}@example.com"},
+        )
+        cur.execute(
+            "INSERT INTO product (sku, name, price) VALUES (%(sku)s, 'Race Check', 10.00);",
+            {"sku": f"RACE{cust_no}"},
+        )
+        cur.execute(
+            """
+            INSERT INTO contains (order_no, sku, qty)
+            SELECT order_no, %(sku)s, order_no %% 5 + 1 FROM unnest(%(orders)s::INTEGER[]) AS order_no;
+            """,
+            {"sku": f"RACE{cust_no}", "orders": order_nos},
+        )
+        cur.execute(
+            """
+            INSERT INTO orders (order_no, cust_no, date)
+            SELECT order_no, %(cust_no)s, CURRENT_DATE FROM unnest(%(orders)s::INTEGER[]) AS order_no;
+            """,
+            {"cust_no": cust_no, "orders": order_nos},
+        )
+    conn.commit()
+    return cust_no, order_nos
+
+
+def teardown(conn, cust_no, order_nos):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM pay WHERE cust_no = %s;", (cust_no,))
+        cur.execute("DELETE FROM contains WHERE order_no = ANY(%s);", (order_nos,))
+        cur.execute("DELETE FROM orders WHERE order_no = ANY(%s);", (order_nos,))
+        cur.execute("DELETE FROM product WHERE sku = %s;", (f"RACE{cust_no}",))
+        cur.execute("DELETE FROM customer WHERE cust_no = %s;", (cust_no,))
+    conn.commit()
+
+
+def pay(cust_no, order_no, start, hold, errors):
+    try:
+        with psycopg.connect(DATABASE_URL) as conn:
+            start.wait()
+            conn.execute(
+                "INSERT INTO pay (order_no, cust_no) VALUES (%s, %s);", (order_no, cust_no)
+            )
+            conn.execute("SELECT pg_sleep(%s);", (hold,))
+    except Exception as e:
+        errors.append(e)
+
+
+def run_round(conn, workers, hold):
+    cust_no, order_nos = setup(conn, workers)
+    try:
+        start = threading.Barrier(workers)
+        errors = []
+        threads = [
+            threading.Thread(target=pay, args=(cust_no, order_no, start, hold, errors))
+            for order_no in order_nos
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        with conn.cursor() as cur:
+            cur.execute(EXPECTED, {"cust_no": cust_no})
+            expected = cur.fetchone()
+            cur.execute("SELECT total, paid_orders FROM customer_value WHERE cust_no = %s;", (cust_no,))
+            kept = cur.fetchone() or (0, 0)
+        conn.commit()
+        return tuple(expected), tuple(kept)
+    finally:
+        teardown(conn, cust_no, order_nos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--hold", type=float, default=0.2, help="seconds each payment waits before its commit")
+    args = parser.parse_args()
+
+    drifted = 0
+    with psycopg.connect(DATABASE_URL) as conn:
+        for round_no in range(1, args.rounds + 1):
+            expected, kept = run_round(conn, args.workers, args.hold)
+            ok = expected == kept
+            drifted += not ok
+            print(f"round {round_no}: expected {expected[0]} over {expected[1]} orders, "
+                  f"customer_value {kept[0]} over {kept[1]}{'' if ok else '  DRIFTED'}")
+    sys.exit(1 if drifted else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import asyncio
+import itertools
+import statistics
+import time
+
+
+async def fetch(host, port, path, method="GET", body=b"", headers=None):
+    """
+    One HTTP/1.1 request on a new connection (Connection: close), read to the
+    end. Returns the status code and the response body.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    head = [f"{method} {path} HTTP/1.1", f"Host: {host}:{port}", "Connection: close"]
+    for name, value in (headers or {}).items():
+        head.append(f"{name}: {value}")
+    if body:
+        head.append(f"Content-Length: {len(body)}")
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    status = int(response.split(b" ", 2)[1]) if response else 0
+    return status, response.partition(b"\r\n\r\n")[2]
+
+
+def percentile(latencies, p):
+    if len(latencies) < 2:
+        return latencies[0] if latencies else None
+    return statistics.quantiles(latencies, n=100, method="inclusive")[p - 1]
+
+
+def summary(latencies, errors, seconds):
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "throughput": round(len(latencies) / seconds, 1) if seconds else None,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+
+def server_ok(status, body):
+    return 0 < status < 500
+
+
+async def load(host, port, requests, concurrency, duration, ok=server_ok):
+    """
+    Sends the (method, path, body) requests round-robin from concurrency
+    clients for duration seconds.
+    Returns the latencies in milliseconds of the answered requests and the
+    count of failed ones (connection errors and responses ok(status, body)
+    rejects, by default status >= 500).
+    """
+    requests = itertools.cycle(requests)
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            method, path, body = next(requests)
+            start = time.perf_counter()
+            try:
+                status, answer = await fetch(host, port, path, method, body, {
+                    "Content-Type": "application/x-www-form-urlencoded",
+                } if body else None)
+            except OSError:
+                status, answer = 0, b""
+            if not ok(status, answer):
+                errors += 1
+            else:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def run(host, port, requests, concurrency=50, duration=10, ok=server_ok):
+    latencies, errors, seconds = asyncio.run(load(host, port, requests, concurrency, duration, ok))
+    return summary(latencies, errors, seconds)
+
+
+async def wait_for_port(host, port, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.2)
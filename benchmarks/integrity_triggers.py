@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+"""
+Time to bulk load orders and workplaces with the integrity checks of
+"create all tables.sql": the statement-level verifica_order and
+verifica_workplace triggers (one anti-join per statement, over its
+transition table) next to the row-level constraint triggers they replaced
+(one NOT IN subquery per row).
+Every load runs in a transaction that is rolled back; the row-level
+triggers are created inside it for the "row" runs.
+
+    DATABASE_URL=postgres://db:db@localhost/db python benchmarks/integrity_triggers.py --rows 100000
+"""
+import argparse
+import json
+import os
+import time
+
+import psycopg
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "postgres://db:db@localhost/db")
+
+# the checks as they were, one call per row
+ROW_TRIGGERS = """
+    DROP TRIGGER verifica_order_insert ON orders;
+    DROP TRIGGER verifica_workplace_insert ON workplace;
+
+    CREATE FUNCTION verifica_order_row_trigger() RETURNS TRIGGER AS $$
+    BEGIN
+        IF NEW.order_no NOT IN (SELECT order_no FROM contains) THEN
+           RAISE EXCEPTION 'O order_no % tem de estar obrigatoriamente Contains.', NEW.order_no;
+        END IF;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE CONSTRAINT TRIGGER verifica_order_row AFTER INSERT OR UPDATE ON orders
+        FOR EACH ROW EXECUTE FUNCTION verifica_order_row_trigger();
+
+    CREATE FUNCTION verifica_workplace_row_trigger() RETURNS TRIGGER AS $$
+    BEGIN
+        IF NEW.address IN (SELECT address FROM office) AND NEW.address IN (SELECT address FROM warehouse) THEN
+           RAISE EXCEPTION 'Um Workplace não pode ser Office e Warehouse ao mesmo tempo.';
+        ELSIF NEW.address NOT IN (SELECT address FROM office) AND NEW.address NOT IN (SELECT address FROM warehouse) THEN
+            RAISE EXCEPTION 'O Workplace % tem de ser obrigatoriamente Office ou Warehouse.', NEW.address;
+        END IF;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE CONSTRAINT TRIGGER verifica_workplace_row AFTER INSERT OR UPDATE ON workplace
+        FOR EACH ROW EXECUTE FUNCTION verifica_workplace_row_trigger();
+    """
+
+# triggers that do not take part in the comparison
+OTHER_TRIGGERS = (
+    ("contains", "product_sales_contains"),
+    ("customer", "customer_city"),
+    ("customer", "customer_catalog"),
+    ("product", "product_catalog"),
+)
+
+
+def setup(cur, rows):
+    for table, trigger in OTHER_TRIGGERS:
+        cur.execute(f"ALTER TABLE {table} DISABLE TRIGGER {trigger};")
+    cur.execute(
+        """
+        INSERT INTO customer (cust_no, name, email) VALUES (-1, 'Benchmark', 'benchmark@example.com');
+        """
+    )
+    cur.execute(
+        """
+        INSERT INTO product (sku, name, price) VALUES ('bench-1', 'Benchmark', 1);
+        """
+    )
+    cur.execute(
+        """
+        INSERT INTO contains (order_no, sku, qty)
+        SELECT -i, 'bench-1', 1 FROM generate_series(1, %(rows)s) AS i;
+        """,
+        {"rows": rows},
+    )
+    cur.execute(
+        """
+        INSERT INTO office (address)
+        SELECT 'bench office ' || i FROM generate_series(1, %(rows)s) AS i;
+        """,
+        {"rows": rows},
+    )
+
+
+LOADS = {
+    "orders": """
+        INSERT INTO orders (order_no, cust_no, date)
+        SELECT -i, -1, DATE '2023-01-01' FROM generate_series(1, %(rows)s) AS i;
+        """,
+    "workplace": """
+        INSERT INTO workplace (address, lat, long)
+        SELECT 'bench office ' || i, i / 100000.0, -i / 100000.0 FROM generate_series(1, %(rows)s) AS i;
+        """,
+}
+
+
+def measure(conn, mode, rows):
+    result = {}
+    with conn.cursor() as cur:
+        if mode == "row":
+            cur.execute(ROW_TRIGGERS)
+        setup(cur, rows)
+        for table, query in LOADS.items():
+            start = time.perf_counter()
+            cur.execute(query, {"rows": rows})
+            # the deferred foreign keys, as the commit would
+            cur.execute("SET CONSTRAINTS ALL IMMEDIATE;")
+            result[table] = round((time.perf_counter() - start) * 1000, 2)
+            cur.execute("SET CONSTRAINTS ALL DEFERRED;")
+    conn.rollback()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    with psycopg.connect(DATABASE_URL) as conn:
+        results = {mode: measure(conn, mode, args.rows) for mode in ("row", "statement")}
+
+    print(f"{'mode':>10}{'orders ms':>12}{'workplace ms':>14}")
+    for mode, result in results.items():
+        print(f"{mode:>10}{result['orders']:>12.2f}{result['workplace']:>14.2f}")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+"""
+Latency of the filtered list pages: the first page of every filter of
+filters.FILTERS, run as the list views run it, with and without the
+indexes of the migrations (which --drop-indexes removes inside a
+transaction that is rolled back). Every query is also EXPLAINed, to show
+the index it uses.
+
+Run it on a database with a few million rows, generated and migrated:
+
+    DATABASE_URL=postgres://db:db@localhost/db flask --app app generate --customers 2000000 --products 500000 --orders 5000000
+    DATABASE_URL=postgres://db:db@localhost/db flask --app app migrate
+    DATABASE_URL=postgres://db:db@localhost/db python benchmarks/list_filters.py
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import psycopg
+from psycopg import sql
+from werkzeug.datastructures import MultiDict
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+
+from filters import filter_condition
+from migrations import MIGRATIONS
+from pagination import PAGE_SIZE
+from pagination import page_query
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "postgres://db:db@localhost/db")
+
+# (table, key, query string) of every case; the values match generated data
+CASES = (
+    ("customer", ("cust_no",), {"q": "Silva"}),
+    ("customer", ("cust_no",), {"q": "customer12345@"}),
+    ("customer", ("cust_no",), {"q": "91234"}),
+    ("product", ("sku",), {"name": "Product 123"}),
+    ("product", ("sku",), {"description": "product 4567"}),
+    ("product", ("sku",), {"min_price": "100", "max_price": "101"}),
+    ("orders", ("order_no",), {"cust_no": "1234"}),
+    ("orders", ("order_no",), {"from": "2024-01-01", "to": "2024-01-07"}),
+    ("orders", ("order_no",), {"cust_no": "1234", "from": "2024-01-01", "to": "2024-12-31"}),
+)
+
+
+def plan(cur, query, params):
+    cur.execute(sql.SQL("EXPLAIN (FORMAT JSON) {}").format(query), params)
+    indexes = set()
+
+    def walk(node):
+        if "Index Name" in node:
+            indexes.add(node["Index Name"])
+        for child in node.get("Plans", ()):
+            walk(child)
+
+    walk(cur.fetchone()[0][0]["Plan"])
+    return sorted(indexes) or ["none"]
+
+
+def measure(cur, table, key, args, runs):
+    query, params = page_query(table, key, PAGE_SIZE, where=filter_condition(table, MultiDict(args)))
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        cur.execute(query, params)
+        cur.fetchall()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": round(statistics.median(latencies), 2),
+        "max_ms": round(max(latencies), 2),
+        "indexes": plan(cur, query, params),
+    }
+
+
+def drop_indexes(cur):
+    for _, _, steps in MIGRATIONS:
+        for step in steps:
+            if isinstance(step, tuple):
+                cur.execute(sql.SQL("DROP INDEX IF EXISTS {};").format(sql.Identifier(step[0])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--drop-indexes", action="store_true", help="also time them without the migration indexes")
+    args = parser.parse_args()
+
+    results = []
+    with psycopg.connect(DATABASE_URL) as conn:
+        with conn.cursor() as cur:
+            for table, key, filters in CASES:
+                results.append({"table": table, "filters": filters, "indexed": measure(cur, table, key, filters, args.runs)})
+            if args.drop_indexes:
+                drop_indexes(cur)
+                for result in results:
+                    key = next(case[1] for case in CASES if case[0] == result["table"])
+                    result["unindexed"] = measure(cur, result["table"], key, result["filters"], args.runs)
+        conn.rollback()
+
+    for result in results:
+        line = f"{result['table']:10}{json.dumps(result['filters']):60}{result['indexed']['median_ms']:>10.2f} ms"
+        if "unindexed" in result:
+            line += f"{result['unindexed']['median_ms']:>12.2f} ms without"
+        print(f"{line}  ({', '.join(result['indexed']['indexes'])})")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
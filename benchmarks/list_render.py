@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+"""
+Render time of the rows of list.html for the product and customer lists,
+per row: the template loop of before (a Jinja lookup per cell, the title
+and colnames.index('price') tested on every one, a url_for per action and
+row) against the RowRenderer of rows.py (one format string per page, one
+str.format per row). Only the rendering is timed, over generated rows, so
+it needs no database:
+
+    python benchmarks/list_render.py --rows 50000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+# the app is imported for its routes and templates: no pool, no connection
+os.environ.setdefault("DATABASE_POOL", "0")
+
+from flask import render_template_string
+from flask import url_for
+
+from app import app
+from rows import euro
+from rows import row_link
+
+# the rows of list.html before rows.py
+BEFORE = """
+{% for record in cursor %}
+  <tr>
+    {% for value in record %}
+      <td>
+        {%if title == 'Product' %}
+          {% if loop.index0 == colnames.index('price') %}
+            {{ value|e if value is not none else '' }}€
+          {% else %}
+          {{ value|e if value is not none else '' }}
+          {% endif %}
+        {%else %}
+        {{ value|e if value is not none else '' }}
+        {% endif %}
+      </td>
+    {% endfor %}
+    {% for action in (row_actions|default([])) %}
+      <td class="{{ action.className }}">
+        <a class="{{ action.className }}" href="{{ action.link(record) }}">{{ action.name }}</a>
+      </td>
+    {% endfor %}
+  </tr>
+{% endfor %}
+"""
+
+# the rows as list.html renders them now
+AFTER = """
+{% for chunk in row_renderer(colnames, row_actions|default([]), formats|default(none)).chunks(cursor) %}{{ chunk }}{% endfor %}
+"""
+
+Product = namedtuple("Product", ("sku", "name", "description", "price", "ean"))
+Customer = namedtuple("Customer", ("cust_no", "name", "email", "phone", "address", "open_orders", "owed"))
+
+
+def products(n):
+    return [
+        Product(f"SKU{i:08}", f"Product {i}", f"Description of product {i}", Decimal(i % 1000) + Decimal("0.99"), 5600000000000 + i)
+        for i in range(n)
+    ]
+
+
+def customers(n):
+    return [
+        Customer(i, f"Customer {i}", f"customer{i}@example.com", f"91{i:07}", f"Street {i}, Lisboa", i % 3, Decimal(i % 500) if i % 3 else None)
+        for i in range(n)
+    ]
+
+
+# (list, rows, context of the view then, context of the view now)
+CASES = (
+    (
+        "list_product",
+        products,
+        {
+            "colnames": Product._fields,
+            "title": "Product",
+            "row_actions": (
+                {"className": "remove", "link": lambda record: url_for("ask_change_product", product=record[0]), "name": "Change"},
+                {"className": "remove", "link": lambda record: url_for("confirm_delete_product", product=record[0]), "name": "Remove"},
+            ),
+        },
+        {
+            "colnames": Product._fields,
+            "formats": {"price": euro},
+            "title": "Product",
+            "row_actions": (
+                {"className": "remove", "link": row_link("ask_change_product", "product"), "name": "Change"},
+                {"className": "remove", "link": row_link("confirm_delete_product", "product"), "name": "Remove"},
+            ),
+        },
+    ),
+    (
+        "list_customer",
+        customers,
+        {
+            "colnames": Customer._fields,
+            "title": "Customer",
+            "row_actions": (
+                {"className": "remove", "link": lambda record: url_for("list_customer_pending", cust=record[0]), "name": "Orders to Pay"},
+                {"className": "remove", "link": lambda record: url_for("confirm_delete_customer", customer=record[0]), "name": "Remove"},
+            ),
+        },
+        {
+            "colnames": Customer._fields,
+            "formats": {"owed": euro},
+            "title": "Customer",
+            "row_actions": (
+                {"className": "remove", "link": row_link("list_customer_pending", "cust"), "name": "Orders to Pay"},
+                {"className": "remove", "link": row_link("confirm_delete_customer", "customer"), "name": "Remove"},
+            ),
+        },
+    ),
+)
+
+
+def best(template, cursor, context, runs):
+    """Fastest of runs renders, in seconds."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        render_template_string(template, cursor=cursor, **context)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results = []
+    with app.test_request_context("/"):
+        for name, generate, before, after in CASES:
+            cursor = generate(args.rows)
+            # compiles both templates before timing
+            render_template_string(BEFORE, cursor=cursor[:1], **before)
+            render_template_string(AFTER, cursor=cursor[:1], **after)
+            then = best(BEFORE, cursor, before, args.runs)
+            now = best(AFTER, cursor, after, args.runs)
+            results.append({
+                "list": name,
+                "rows": args.rows,
+                "before_us_per_row": round(then / args.rows * 1e6, 2),
+                "after_us_per_row": round(now / args.rows * 1e6, 2),
+                "speedup": round(then / now, 1),
+            })
+
+    for result in results:
+        print(
+            f"{result['list']:15}{result['before_us_per_row']:>10.2f} us/row before"
+            f"{result['after_us_per_row']:>10.2f} us/row now{result['speedup']:>8.1f}x"
+        )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+"""
+Latency of placing one order against the size of its basket: one INSERT per
+contains line (the way /orders/insert used to work) next to the single
+statement of orders.insert_order.
+Every order is placed in a transaction that is rolled back after the
+checks of the commit (verifica_order, the deferred contains_order_no_fkey)
+ran, so the database is left as it was.
+
+    DATABASE_URL=postgres://db:db@localhost/db python benchmarks/order_ingest.py --sizes 1,10,100,1000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import psycopg
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+
+from orders import insert_order
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "postgres://db:db@localhost/db")
+
+ORDER_NO = -1
+CUST_NO = -1
+
+
+def setup(cur, size):
+    """Customer and products the benchmark orders use, inside the transaction."""
+    cur.execute(
+        """
+        INSERT INTO customer (cust_no, name, email) VALUES (%(cust_no)s, 'Benchmark', 'benchmark@example.com');
+        """,
+        {"cust_no": CUST_NO},
+    )
+    cur.execute(
+        """
+        INSERT INTO product (sku, name, price)
+        SELECT 'bench-' || i, 'Benchmark ' || i, 1 FROM generate_series(1, %(size)s) AS i;
+        """,
+        {"size": size},
+    )
+    return {f"bench-{i}": 1 + i % 5 for i in range(1, size + 1)}
+
+
+def row_by_row(cur, header, basket):
+    for sku, qty in basket.items():
+        cur.execute(
+            """
+            INSERT INTO contains (order_no, sku, qty) VALUES (%(order_no)s, %(sku)s, %(qty)s);
+            """,
+            {"order_no": header["order_no"], "sku": sku, "qty": qty},
+        )
+    cur.execute(
+        """
+        INSERT INTO orders (order_no, cust_no, date) VALUES (%(order_no)s, %(cust_no)s, %(date)s);
+        """,
+        header,
+    )
+
+
+def batch(cur, header, basket):
+    insert_order(cur, header, basket)
+
+
+METHODS = {"row_by_row": row_by_row, "batch": batch}
+
+
+def measure(conn, method, size, repeat):
+    header = {"order_no": ORDER_NO, "cust_no": CUST_NO, "date": "2023-01-01"}
+    times = []
+    for _ in range(repeat):
+        with conn.cursor() as cur:
+            basket = setup(cur, size)
+            start = time.perf_counter()
+            METHODS[method](cur, header, basket)
+            # what the commit would check
+            cur.execute("SET CONSTRAINTS ALL IMMEDIATE;")
+            times.append(time.perf_counter() - start)
+        conn.rollback()
+    return {
+        "median_ms": round(statistics.median(times) * 1000, 2),
+        "min_ms": round(min(times) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,10,50,200,1000", help="basket sizes, comma separated")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    results = {}
+    with psycopg.connect(DATABASE_URL) as conn:
+        for size in sizes:
+            results[size] = {method: measure(conn, method, size, args.repeat) for method in METHODS}
+
+    print(f"{'lines':>8}{'row_by_row ms':>16}{'batch ms':>12}")
+    for size, result in results.items():
+        print(f"{size:>8}{result['row_by_row']['median_ms']:>16.2f}{result['batch']['median_ms']:>12.2f}")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
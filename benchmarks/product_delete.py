@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+"""
+Time to delete products from a large contains table: the NOT IN cleanup
+delete_product used to run, next to the single statement of
+products.delete_products, for one SKU and for a batch of SKUs.
+The dataset is generated inside a transaction (with the user triggers of the
+tables turned off while loading) and rolled back at the end, and every
+deletion runs in a savepoint that is rolled back after it is timed.
+
+    DATABASE_URL=postgres://db:db@localhost/db python benchmarks/product_delete.py --orders 1000000 --lines 3
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import psycopg
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+
+from queries import STATEMENTS
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "postgres://db:db@localhost/db")
+
+TABLES = ("customer", "orders", "pay", "product", "contains", "supplier")
+
+# the statements of delete_product before it only looked at affected orders
+NOT_IN_CLEANUP = (
+    """
+    DELETE FROM delivery WHERE tin IN (
+        SELECT tin FROM supplier WHERE sku = ANY(%(skus)s::VARCHAR[])
+    );
+    """,
+    """
+    DELETE FROM supplier WHERE sku = ANY(%(skus)s::VARCHAR[]);
+    """,
+    """
+    DELETE FROM contains WHERE sku = ANY(%(skus)s::VARCHAR[]);
+    """,
+    """
+    DELETE FROM process WHERE order_no NOT IN (
+        SELECT order_no FROM contains
+    );
+    """,
+    """
+    DELETE FROM pay WHERE order_no NOT IN (
+        SELECT order_no FROM contains
+    );
+    """,
+    """
+    DELETE FROM orders WHERE order_no NOT IN (
+        SELECT order_no FROM contains
+    );
+    """,
+    """
+    DELETE FROM product WHERE sku = ANY(%(skus)s::VARCHAR[]);
+    """,
+)
+
+METHODS = {
+    "not_in": NOT_IN_CLEANUP,
+    "affected_orders": (STATEMENTS["delete_products"],),
+}
+
+
+def load(cur, orders, lines, products):
+    for table in TABLES:
+        cur.execute(f"ALTER TABLE {table} DISABLE TRIGGER USER;")
+    cur.execute(
+        """
+        INSERT INTO customer (cust_no, name, email) VALUES (-1, 'Benchmark', 'benchmark@example.com');
+        """
+    )
+    cur.execute(
+        """
+        INSERT INTO product (sku, name, price)
+        SELECT 'bench-' || i, 'Benchmark ' || i, 1 FROM generate_series(1, %(products)s) AS i;
+        """,
+        {"products": products},
+    )
+    cur.execute(
+        """
+        INSERT INTO orders (order_no, cust_no, date)
+        SELECT -i, -1, DATE '2023-01-01' + i %% 365 FROM generate_series(1, %(orders)s) AS i;
+        """,
+        {"orders": orders},
+    )
+    # lines SKUs per order, spread over every product
+    cur.execute(
+        """
+        INSERT INTO contains (order_no, sku, qty)
+        SELECT -i, 'bench-' || (1 + (i * 7919 + j) %% %(products)s), 1
+        FROM generate_series(1, %(orders)s) AS i, generate_series(1, %(lines)s) AS j
+        ON CONFLICT DO NOTHING;
+        """,
+        {"orders": orders, "lines": lines, "products": products},
+    )
+    cur.execute(
+        """
+        INSERT INTO pay (order_no, cust_no) SELECT order_no, -1 FROM orders WHERE cust_no = -1 AND mod(order_no, 2) = 0;
+        """
+    )
+    for table in TABLES:
+        cur.execute(f"ALTER TABLE {table} ENABLE TRIGGER USER;")
+    for table in TABLES:
+        cur.execute(f"ANALYZE {table};")
+
+
+def measure(conn, method, skus):
+    with conn.cursor() as cur:
+        cur.execute("SAVEPOINT benchmark;")
+        start = time.perf_counter()
+        for query in METHODS[method]:
+            cur.execute(query, {"skus": skus})
+        cur.execute("SET CONSTRAINTS ALL IMMEDIATE;")
+        elapsed = time.perf_counter() - start
+        cur.execute("ROLLBACK TO SAVEPOINT benchmark;")
+    return round(elapsed * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=1000000)
+    parser.add_argument("--lines", type=int, default=3, help="contains lines per order")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=100, help="SKUs of the batch deletion")
+    args = parser.parse_args()
+
+    cases = {
+        "1 sku": ["bench-1"],
+        f"{args.batch} skus": [f"bench-{i}" for i in range(1, args.batch + 1)],
+    }
+    results = {}
+    with psycopg.connect(DATABASE_URL) as conn:
+        with conn.cursor() as cur:
+            start = time.perf_counter()
+            load(cur, args.orders, args.lines, args.products)
+            print(f"loaded {args.orders * args.lines} contains lines in {time.perf_counter() - start:.1f}s")
+        for case, skus in cases.items():
+            results[case] = {method: measure(conn, method, skus) for method in METHODS}
+        conn.rollback()
+
+    print(f"{'case':>12}{'not_in ms':>14}{'affected_orders ms':>20}")
+    for case, result in results.items():
+        print(f"{case:>12}{result['not_in']:>14.2f}{result['affected_orders']:>20.2f}")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/python3
+"""
+Load test of the app route by route: starts it with gunicorn (wsgi.py)
+against the database of DATABASE_URL, drives every route in turn with
+--concurrency clients for --duration seconds, and reports the latency
+percentiles, the throughput and the database statements and transactions
+per request of each one. The results are saved as JSON, tagged with the
+commit, to compare them with another run (--compare).
+
+    DATABASE_URL=postgres://db:db@localhost/db python benchmarks/routes.py --setup --dataset medium
+    DATABASE_URL=postgres://db:db@localhost/db python benchmarks/routes.py --compare benchmarks/results/routes-abc1234.json
+
+--setup DROPS every table and loads "create all tables.sql" and a generated
+dataset of the --dataset size. Statement counts need the
+pg_stat_statements extension (they are left out without it).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+import psycopg
+
+from http_load import run
+from http_load import wait_for_port
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+APP_DIR = os.path.join(ROOT, "app")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+DATABASE_URL = os.environ.get("DATABASE_URL", "postgres://db:db@localhost/db")
+
+DATASETS = {
+    "small": {"customers": 1000, "products": 200, "orders": 10000},
+    "medium": {"customers": 10000, "products": 1000, "orders": 100000},
+    "large": {"customers": 100000, "products": 10000, "orders": 1000000},
+}
+
+# keys of the rows the run creates, so they do not collide with another run
+RUN = datetime.now().strftime("%H%M%S")
+
+
+def app_ok(status, body):
+    # the views answer their errors with a 200 error page
+    return 0 < status < 500 and b"Something went wrong" not in body
+
+
+def form(**fields):
+    return urlencode(fields).encode()
+
+
+def setup(dataset):
+    with open(os.path.join(ROOT, "create all tables.sql"), encoding="utf-8") as schema:
+        script = schema.read()
+    with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+        conn.execute(script)
+    env = {**os.environ, "DATABASE_URL": DATABASE_URL}
+    flask = [sys.executable, "-m", "flask", "--app", "app"]
+    options = [f"--{name}={value}" for name, value in DATASETS[dataset].items()]
+    subprocess.run(flask + ["generate", *options], cwd=APP_DIR, env=env, check=True)
+    subprocess.run(flask + ["migrate"], cwd=APP_DIR, env=env, check=True)
+
+
+def sample(cur, query, size=5000):
+    cur.execute(query + " ORDER BY random() LIMIT %(size)s;", {"size": size})
+    return [row[0] for row in cur.fetchall()]
+
+
+def next_key(cur, table, column):
+    cur.execute(f"SELECT COALESCE(max({column}), 0) + 1 FROM {table};")
+    return cur.fetchone()[0]
+
+
+def routes(cur):
+    """
+    (name, requests) of every route in the order they are run: reads first,
+    then inserts, then the deletes of what the inserts created. requests are
+    iterables of (method, path, body); the write ones never repeat a key.
+    """
+    orders = sample(cur, "SELECT order_no FROM orders")
+    customers = sample(cur, "SELECT cust_no FROM customer")
+    skus = sample(cur, "SELECT sku FROM product")
+    cur.execute(
+        "SELECT order_no, cust_no FROM orders WHERE NOT EXISTS "
+        "(SELECT FROM pay WHERE pay.order_no = orders.order_no) LIMIT 100000;"
+    )
+    unpaid = cur.fetchall()
+    first_cust_no = next_key(cur, "customer", "cust_no")
+    first_order_no = next_key(cur, "orders", "order_no")
+    rng = random.Random(0)
+    created = {"customer": [], "product": [], "supplier": []}
+
+    def new_customers():
+        for cust_no in itertools.count(first_cust_no):
+            created["customer"].append(cust_no)
+            yield "POST", "/customer/insert", form(
+                cust_no=cust_no, name="Benchmark", email=f"bench{cust_no}@example.com",
+                phone="+351900000000", address="Rua Augusta 1, 1100-053 Lisboa",
+            )
+
+    def new_products():
+        for i in itertools.count():
+            sku = f"b{RUN}-{i}"
+            created["product"].append(sku)
+            yield "POST", "/product/insert", form(
+                sku=sku, name="Benchmark", description="", price="9.99", ean="",
+            )
+
+    def new_suppliers():
+        for i in itertools.count():
+            tin = f"b{RUN}-{i}"
+            created["supplier"].append(tin)
+            yield "POST", "/supplier/insert", form(
+                tin=tin, name="Benchmark", address="", sku=rng.choice(skus), date="2023-01-01",
+            )
+
+    def new_orders():
+        for order_no in itertools.count(first_order_no):
+            lines = "\n".join(
+                json.dumps({"sku": sku, "qty": rng.randint(1, 5)})
+                for sku in rng.sample(skus, min(len(skus), rng.randint(1, 5)))
+            )
+            yield "POST", "/orders/insert", form(
+                order_no=order_no, cust_no=rng.choice(customers), date="2023-01-01", lines=lines,
+            )
+
+    def payments():
+        for order_no, cust_no in unpaid:
+            yield "POST", "/customer/pay", form(order_no=order_no, cust_no=cust_no)
+
+    def deletes(table, field, path):
+        # what the insert of the same table created (read once it ran)
+        for key in list(created[table]):
+            yield "POST", path, form(**{field: key})
+
+    return (
+        ("GET /customer", [("GET", "/customer", b"")]),
+        ("GET /product", [("GET", "/product", b"")]),
+        ("GET /orders", [("GET", "/orders", b"")]),
+        ("GET /orders/<n>/contains", [("GET", f"/orders/{n}/contains", b"") for n in orders]),
+        ("GET /customer/<n>/orders", [("GET", f"/customer/{n}/orders", b"") for n in customers]),
+        ("GET /orders/insert", [("GET", "/orders/insert", b"")]),
+        ("POST /customer/insert", new_customers()),
+        ("POST /product/insert", new_products()),
+        ("POST /supplier/insert", new_suppliers()),
+        ("POST /orders/insert", new_orders()),
+        ("POST /customer/pay", payments()),
+        ("POST /supplier/delete", lambda: deletes("supplier", "tin", "/supplier/delete")),
+        ("POST /product/delete", lambda: deletes("product", "sku", "/product/delete")),
+        ("POST /customer/delete", lambda: deletes("customer", "cust_no", "/customer/delete")),
+    )
+
+
+def db_counters(conn):
+    """Statements run (if pg_stat_statements is there) and transactions ended in the database."""
+    time.sleep(1)  # the statistics of the server processes are flushed about every second
+    conn.execute("SELECT pg_stat_clear_snapshot();")
+    transactions = conn.execute(
+        "SELECT xact_commit + xact_rollback FROM pg_stat_database WHERE datname = current_database();"
+    ).fetchone()[0]
+    try:
+        statements = conn.execute(
+            "SELECT sum(calls) FROM pg_stat_statements "
+            "WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database());"
+        ).fetchone()[0]
+    except psycopg.errors.UndefinedTable:
+        statements = None
+    return statements, transactions
+
+
+def per_request(before, after, requests):
+    if before is None or after is None or not requests:
+        return None
+    return round(float(after - before) / requests, 2)
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, path):
+    with open(path, encoding="utf-8") as file:
+        old = json.load(file)
+    print(f"\ncompared with {old.get('commit')} ({path})")
+    print(f"{'route':32}{'p95 ms':>10}{'was':>10}{'req/s':>10}{'was':>10}")
+    for route, result in results["routes"].items():
+        before = old["routes"].get(route)
+        if before is None:
+            continue
+        print(f"{route:32}{result['p95_ms'] or 0:>10.1f}{before['p95_ms'] or 0:>10.1f}"
+              f"{result['throughput'] or 0:>10.1f}{before['throughput'] or 0:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--setup", action="store_true", help="recreate the database with a generated dataset")
+    parser.add_argument("--dataset", choices=tuple(DATASETS), default="small")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4, help="threads per gunicorn worker")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per route")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--route", action="append", dest="only", help="run only this route (repeatable)")
+    parser.add_argument("--output", help="defaults to benchmarks/results/routes-<commit>.json")
+    parser.add_argument("--compare", help="results of another run to compare with")
+    args = parser.parse_args()
+
+    if args.setup:
+        setup(args.dataset)
+
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn", "wsgi:app",
+            "--bind", f"127.0.0.1:{args.port}",
+            "--workers", str(args.workers),
+            "--threads", str(args.threads),
+        ],
+        cwd=APP_DIR,
+        env={**os.environ, "DATABASE_URL": DATABASE_URL},
+        stderr=subprocess.DEVNULL,
+    )
+    results = {
+        "commit": commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "options": vars(args),
+        "routes": {},
+    }
+    try:
+        asyncio.run(wait_for_port("127.0.0.1", args.port))
+        with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+            for name, requests in routes(conn.cursor()):
+                if args.only and name not in args.only:
+                    continue
+                if callable(requests):
+                    requests = requests()
+                before = db_counters(conn)
+                result = run("127.0.0.1", args.port, requests, args.concurrency, args.duration, ok=app_ok)
+                after = db_counters(conn)
+                answered = result["requests"] + result["errors"]
+                result["statements_per_request"] = per_request(before[0], after[0], answered)
+                result["transactions_per_request"] = per_request(before[1], after[1], answered)
+                results["routes"][name] = result
+                print(f"{name:32}{result['throughput'] or 0:>8} req/s  p50 {result['p50_ms'] or 0:.1f}"
+                      f"  p95 {result['p95_ms'] or 0:.1f}  p99 {result['p99_ms'] or 0:.1f} ms"
+                      f"  {result['statements_per_request']} stmt/req  {result['errors']} errors")
+    finally:
+        server.terminate()
+        server.wait()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"routes-{results['commit'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"saved {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
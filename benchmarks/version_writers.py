@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+"""
+Check of the table_version bumps under concurrent writers of several
+tables: --workers connections run transactions that write a customer and
+then a product, or a product and then a customer (every other worker), each
+on rows of its own and waiting --hold seconds between the two statements
+so the transactions overlap. When each statement bumped its table's version
+as it ran, the two orders deadlocked on the version rows; now the versions
+are bumped at commit, in the order of the table names. Reports the
+transactions committed per second and the deadlocks, and exits with 1 when
+there was any. The rows are written with the values they have, so the data
+is left as it was (the versions are bumped).
+
+    DATABASE_URL=postgres://db:db@localhost/db python benchmarks/version_writers.py --workers 8 --seconds 10
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import psycopg
+from psycopg import errors
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "postgres://db:db@localhost/db")
+
+CUSTOMER = "UPDATE customer SET name = name WHERE cust_no = %s;"
+PRODUCT = "UPDATE product SET description = description WHERE sku = %s;"
+
+
+def rows(workers):
+    """A customer and a product for each worker."""
+    with psycopg.connect(DATABASE_URL) as conn:
+        customers = [row[0] for row in conn.execute("SELECT cust_no FROM customer ORDER BY cust_no LIMIT %s;", (workers,))]
+        products = [row[0] for row in conn.execute("SELECT sku FROM product ORDER BY sku LIMIT %s;", (workers,))]
+    if len(customers) < workers or len(products) < workers:
+        sys.exit(f"Needs {workers} customers and products (flask --app app generate).")
+    return list(zip(customers, products))
+
+
+def write(worker, cust_no, sku, hold, deadline, results):
+    statements = [(CUSTOMER, cust_no), (PRODUCT, sku)]
+    if worker % 2:
+        statements.reverse()
+    committed = deadlocks = 0
+    with psycopg.connect(DATABASE_URL) as conn:
+        while time.monotonic() < deadline:
+            try:
+                with conn.transaction():
+                    for i, (statement, value) in enumerate(statements):
+                        if i:
+                            time.sleep(hold)
+                        conn.execute(statement, (value,))
+                committed += 1
+            except errors.DeadlockDetected:
+                deadlocks += 1
+    results[worker] = (committed, deadlocks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--hold", type=float, default=0.01, help="seconds between the two writes of a transaction")
+    args = parser.parse_args()
+
+    results = {}
+    deadline = time.monotonic() + args.seconds
+    threads = [
+        threading.Thread(target=write, args=(worker, cust_no, sku, args.hold, deadline, results))
+        for worker, (cust_no, sku) in enumerate(rows(args.workers))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    committed = sum(result[0] for result in results.values())
+    deadlocks = sum(result[1] for result in results.values())
+    print(f"{committed} transactions ({committed / args.seconds:.1f}/s), {deadlocks} deadlocks")
+    sys.exit(1 if deadlocks else 0)
+
+
+if __name__ == "__main__":
+    main()